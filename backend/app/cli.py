@@ -0,0 +1,177 @@
+"""Command line entry points for offline jobs, run from the backend directory:
+
+    python -m app.cli build-index
+    python -m app.cli train-mf
+    python -m app.cli materialize
+    python -m app.cli ingest --fixtures path/to/tmdb-dumps
+    python -m app.cli bench-db
+"""
+import argparse
+import asyncio
+import sys
+import time
+from app.config import settings
+from app.models.database import Base, SessionLocal, engine
+from app.models.migrations import run_migrations
+from app.services.db_benchmark import benchmark_sqlite_profiles
+from app.services.ingestion import IngestCheckpoint, ingest_from_fixtures, ingest_from_tmdb
+from app.services.matrix_factorization import MatrixFactorizationModel, train_als
+from app.services.recommendation_batch import materialize_recommendations
+from app.services.recommendation_service import RecommendationService, load_interactions
+import logging
+
+logger = logging.getLogger(__name__)
+
+def build_index(args) -> int:
+    """Fit the content index and its nearest-neighbour index over the whole catalog"""
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        if not RecommendationService(index_dir=args.index_dir).build_content_index(db):
+            logger.warning("No movies to index")
+            return 1
+    finally:
+        db.close()
+
+    logger.info(f"Built content index in {time.perf_counter() - started:.1f}s")
+    return 0
+
+def train_mf(args) -> int:
+    """Train the matrix factorisation model and write it where the API hot-reloads it from"""
+    db = SessionLocal()
+    try:
+        interactions = load_interactions(db)
+    finally:
+        db.close()
+
+    if not interactions.user_items.nnz:
+        logger.warning("No ratings or watch history to train on")
+        return 1
+
+    started = time.perf_counter()
+    user_factors, item_factors = train_als(
+        interactions.user_items,
+        factors=args.factors,
+        regularization=args.regularization,
+        alpha=args.alpha,
+        iterations=args.iterations
+    )
+
+    MatrixFactorizationModel(args.model_dir).save(
+        user_factors,
+        item_factors,
+        interactions.user_ids,
+        interactions.item_ids,
+        interactions.user_items
+    )
+    logger.info(
+        f"Trained {args.factors} factors for {user_factors.shape[0]} users and "
+        f"{item_factors.shape[0]} items in {time.perf_counter() - started:.1f}s"
+    )
+    return 0
+
+def materialize(args) -> int:
+    """Materialise every user's recommendations and report throughput"""
+    stats = materialize_recommendations(limit=args.limit, chunk_size=args.chunk_size, workers=args.workers)
+    logger.info(
+        f"Materialised {stats['rows']} recommendations for {stats['users']} users "
+        f"with {stats['workers']} workers in {stats['seconds']:.1f}s "
+        f"({stats['users_per_second']:.1f} users/sec, model {stats['model_version']})"
+    )
+    return 0
+
+def parse_years(value: str) -> range:
+    """A year or an inclusive range of years such as 1990-2024"""
+    start, _, end = value.partition("-")
+    return range(int(start), int(end or start) + 1)
+
+def ingest(args) -> int:
+    """Load movies into the local catalog from TMDB or from a directory of TMDB JSON dumps"""
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+
+    checkpoint = IngestCheckpoint(args.checkpoint)
+    if args.reset:
+        checkpoint.reset()
+
+    if args.fixtures:
+        stats = asyncio.run(ingest_from_fixtures(args.fixtures, checkpoint, batch_size=args.batch_size))
+    else:
+        stats = asyncio.run(ingest_from_tmdb(
+            checkpoint,
+            batch_size=args.batch_size,
+            source=args.source,
+            years=args.years,
+            max_pages=args.max_pages,
+            concurrency=args.concurrency
+        ))
+
+    logger.info(
+        f"Ingested {stats['movies']} movies from {stats['pages']} pages "
+        f"({stats['inserted']} new, {stats['updated']} updated) in {stats['seconds']:.1f}s "
+        f"({stats['movies_per_second']:.0f} movies/sec)"
+    )
+    if stats["inserted"]:
+        logger.info("Run build-index to fit the content index over the new catalog")
+    return 0
+
+def bench_db(args) -> int:
+    """Compare concurrent read/write throughput of SQLite's defaults against the configured pragmas"""
+    results = benchmark_sqlite_profiles(seconds=args.seconds, readers=args.readers, writers=args.writers, directory=args.dir)
+    for kind in ("read", "write"):
+        default, tuned = results["default"][kind], results["tuned"][kind]
+        logger.info(
+            f"{kind}s: {default['ops_per_second']:.0f}/sec -> {tuned['ops_per_second']:.0f}/sec "
+            f"({tuned['ops_per_second'] / max(default['ops_per_second'], 1e-9):.1f}x), "
+            f"p99 {default['p99_ms']:.1f}ms -> {tuned['p99_ms']:.1f}ms, "
+            f"lock errors {default['errors']} -> {tuned['errors']}"
+        )
+    return 0
+
+def main(argv=None) -> int:
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description="Movie Recommendation System jobs")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    index = subparsers.add_parser("build-index", help="Build the content and nearest-neighbour indexes")
+    index.add_argument("--index-dir", default=settings.recommendation_index_dir)
+    index.set_defaults(func=build_index)
+
+    train = subparsers.add_parser("train-mf", help="Train the matrix factorisation model")
+    train.add_argument("--model-dir", default=settings.mf_model_dir)
+    train.add_argument("--factors", type=int, default=32)
+    train.add_argument("--regularization", type=float, default=0.1)
+    train.add_argument("--alpha", type=float, default=40.0)
+    train.add_argument("--iterations", type=int, default=15)
+    train.set_defaults(func=train_mf)
+
+    batch = subparsers.add_parser("materialize", help="Write every user's recommendations to user_recommendations")
+    batch.add_argument("--limit", type=int, default=50, help="Recommendations kept per user")
+    batch.add_argument("--chunk-size", type=int, default=200, help="Users scored per batch")
+    batch.add_argument("--workers", type=int, default=None, help="Worker processes, defaults to the CPU count")
+    batch.set_defaults(func=materialize)
+
+    load = subparsers.add_parser("ingest", help="Load movies and genres into the local catalog")
+    load.add_argument("--fixtures", help="Directory of TMDB JSON dumps to read instead of calling TMDB")
+    load.add_argument("--source", choices=["popular", "discover"], default="popular")
+    load.add_argument("--years", type=parse_years, default=None, help="Release years to discover, e.g. 1990-2024")
+    load.add_argument("--max-pages", type=int, default=500, help="Pages walked per listing")
+    load.add_argument("--concurrency", type=int, default=8, help="TMDB pages fetched at once")
+    load.add_argument("--batch-size", type=int, default=1000, help="Movies written per transaction")
+    load.add_argument("--checkpoint", default=settings.ingest_checkpoint_path)
+    load.add_argument("--reset", action="store_true", help="Forget the checkpoint and start over")
+    load.set_defaults(func=ingest)
+
+    bench = subparsers.add_parser("bench-db", help="Benchmark SQLite defaults against the configured pragmas on scratch files")
+    bench.add_argument("--seconds", type=float, default=10.0, help="Duration of each run")
+    bench.add_argument("--readers", type=int, default=8, help="Threads reading watch history")
+    bench.add_argument("--writers", type=int, default=2, help="Threads adding watch history")
+    bench.add_argument("--dir", default=None, help="Where to create the scratch databases, the disk matters")
+    bench.set_defaults(func=bench_db)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
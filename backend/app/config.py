@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import Dict, List
 import json
 from functools import lru_cache
 
@@ -9,6 +9,18 @@ class Settings(BaseSettings):
     postgres_user: str = "postgres"
     postgres_password: str = ""
 
+    # Database engine settings
+    db_pool_size: int = 32  # connections kept open, match blocking_io_threads so queries don't queue for one
+    db_max_overflow: int = 16
+    db_pool_timeout_seconds: float = 30.0
+    db_pool_recycle_seconds: int = 1800  # PostgreSQL only, reconnect before the server or a proxy drops idle connections
+    db_pool_pre_ping: bool = True  # PostgreSQL only
+    sqlite_journal_mode: str = "WAL"  # readers don't block on writers and commits append to the WAL
+    sqlite_synchronous: str = "NORMAL"  # fsync at checkpoints rather than every commit, safe under WAL
+    sqlite_busy_timeout_ms: int = 5000  # how long a writer waits for the lock before "database is locked"
+    sqlite_cache_size_kb: int = 64 * 1024  # page cache per connection
+    sqlite_mmap_size: int = 256 * 1024 * 1024  # bytes of the file read through mmap, 0 disables it
+
     # JWT settings
     secret_key: str
     algorithm: str = "HS256"
@@ -18,11 +30,55 @@ class Settings(BaseSettings):
     tmdb_api_key: str
     tmdb_access_token: str
     tmdb_base_url: str = "https://api.themoviedb.org/3"
+    tmdb_http2: bool = True
+    tmdb_max_connections: int = 100
+    tmdb_max_keepalive_connections: int = 20
+    tmdb_keepalive_expiry_seconds: float = 30.0
+    tmdb_timeout_seconds: float = 10.0
+    tmdb_connect_timeout_seconds: float = 5.0
+    tmdb_cache_size: int = 5000
+    tmdb_cache_path: str = ""  # e.g. data/tmdb_cache.db to keep responses across restarts
+    tmdb_cache_ttls: Dict[str, int] = {}  # overrides TMDBService.CACHE_TTLS, e.g. {"popular": 300}
+    tmdb_cache_stale_factor: float = 1.0  # serve stale for this many TTLs while refreshing
+    tmdb_rate_limit_per_second: float = 40.0  # 0 disables the client-side limiter
+    tmdb_rate_limit_burst: int = 40
+    tmdb_max_retries: int = 3
+    tmdb_backoff_base_seconds: float = 0.5
+    tmdb_backoff_max_seconds: float = 8.0  # also the longest Retry-After a request will wait out
+    tmdb_circuit_failure_threshold: int = 5  # consecutive failures before TMDB is treated as down
+    tmdb_circuit_reset_seconds: float = 30.0
+    tmdb_bulk_concurrency: int = 10  # requests in flight at once for bulk fetches
 
     # CORS settings
     cors_origins: List[str] = []
     frontend_url: str = "http://127.0.0.1:5500"
 
+    # Recommendation settings
+    recommendation_index_dir: str = "data/recommendations"
+    mf_model_dir: str = "data/mf"
+    content_index_rebuild_ratio: float = 0.1  # refit once this share of rows was appended
+    content_index_rebuild_interval_hours: float = 24.0
+    recommendation_cache_size: int = 10000
+    recommendation_cache_ttl_seconds: int = 3600
+    recommendation_cache_path: str = ""  # e.g. data/recommendation_cache.db to keep results across restarts
+
+    # Catalog ingestion settings
+    ingest_checkpoint_path: str = "data/ingest_checkpoint.json"
+    movie_details_ttl_hours: float = 7 * 24  # local details older than this are refetched from TMDB
+
+    # Local search settings
+    search_min_local_results: int = 5  # fewer local matches than this falls back to TMDB search
+    search_index_sync_seconds: float = 5.0  # how often searches look for newly saved movies
+    search_index_rebuild_delta: int = 1000  # rebuild once this many movies sit in the delta
+    search_index_rebuild_interval_hours: float = 24.0
+
+    # Execution settings
+    blocking_io_threads: int = 32  # threads running DB queries and other blocking calls
+    scoring_processes: int = 2  # worker processes scoring recommendations online, 0 scores in a thread
+    scoring_queue_size: int = 8  # scoring jobs in flight at once, further callers wait
+    loop_lag_debug: bool = False  # log the stack of whatever blocks the event loop
+    loop_lag_threshold_ms: float = 100.0
+
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
@@ -1,9 +1,16 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from sqlalchemy.orm import Session
 from app.models import database
-from app.routers import auth, movies, recommendations, users
+from app.models.migrations import run_migrations
+from app.routers import auth, movies, recommendations, users, metrics
+from app.services.recommendation_service import recommendation_service
+from app.services.search_service import search_service
+from app.services.tmdb_service import tmdb_service
+from app.utils.executors import configure_event_loop
+from app.utils.loop_monitor import LoopLagMonitor
 from app.config import settings
 import logging
 
@@ -11,7 +18,42 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Movie Recommendation System")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Blocking calls all go through one sized thread pool
+    configure_event_loop()
+    
+    # Create tables
+    database.Base.metadata.create_all(bind=database.engine)
+    run_migrations(database.engine)
+    
+    # Load the persisted models so the first request doesn't have to build them
+    recommendation_service.load_models()
+    
+    # Index the local catalog for /movies/search
+    db = database.SessionLocal()
+    try:
+        search_service.build(db)
+    finally:
+        db.close()
+    
+    # Open the pooled TMDB client for the lifetime of the app
+    await tmdb_service.start()
+    
+    # In debug, report handlers that block the loop, startup above is allowed to
+    loop_monitor = LoopLagMonitor(settings.loop_lag_threshold_ms / 1000) if settings.loop_lag_debug else None
+    app.state.loop_monitor = loop_monitor
+    if loop_monitor is not None:
+        loop_monitor.start()
+    yield
+    await tmdb_service.close()
+    await database.async_engine.dispose()
+    if recommendation_service.scoring_pool is not None:
+        recommendation_service.scoring_pool.shutdown()
+    if loop_monitor is not None:
+        loop_monitor.stop()
+
+app = FastAPI(title="Movie Recommendation System", lifespan=lifespan)
 
 # CORS middleware configuration
 app.add_middleware(
@@ -31,12 +73,7 @@ app.include_router(auth.router)
 app.include_router(movies.router)
 app.include_router(recommendations.router)
 app.include_router(users.router)
-
-# Create database tables
-@app.on_event("startup")
-async def startup():
-    # Create tables
-    database.Base.metadata.create_all(bind=database.engine)
+app.include_router(metrics.router)
 
 # Root endpoint
 @app.get("/")
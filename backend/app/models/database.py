@@ -1,17 +1,78 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from app.config import DATABASE_URL
+from app.config import DATABASE_URL, settings
 
-# Create database engine
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
-)
+def async_database_url(url: str) -> str:
+    """The same database through its asyncio driver: aiosqlite for SQLite, asyncpg for PostgreSQL"""
+    scheme, _, rest = url.partition("://")
+    dialect = scheme.split("+")[0]
+    if dialect == "sqlite":
+        return f"sqlite+aiosqlite://{rest}"
+    if dialect in ("postgresql", "postgres"):
+        return f"postgresql+asyncpg://{rest}"
+    return url
+
+def engine_options(url: str) -> dict:
+    """Pool settings for an engine on url, from the database settings"""
+    url = make_url(url)
+    if url.get_backend_name() == "sqlite":
+        # In-memory databases live in a single connection, SQLAlchemy picks its own pool for them
+        if url.database in (None, "", ":memory:"):
+            return {}
+        return {
+            "pool_size": settings.db_pool_size,
+            "max_overflow": settings.db_max_overflow,
+            "pool_timeout": settings.db_pool_timeout_seconds
+        }
+
+    return {
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout_seconds,
+        "pool_recycle": settings.db_pool_recycle_seconds,
+        "pool_pre_ping": settings.db_pool_pre_ping
+    }
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Apply the SQLite settings to every new connection, all but journal_mode last only for the connection"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={settings.sqlite_journal_mode}")
+    cursor.execute(f"PRAGMA synchronous={settings.sqlite_synchronous}")
+    cursor.execute(f"PRAGMA busy_timeout={int(settings.sqlite_busy_timeout_ms)}")
+    # A negative cache_size is in KiB rather than pages
+    cursor.execute(f"PRAGMA cache_size=-{int(settings.sqlite_cache_size_kb)}")
+    cursor.execute(f"PRAGMA mmap_size={int(settings.sqlite_mmap_size)}")
+    cursor.close()
+
+def create_database_engine(url: str, sqlite_pragmas: bool = True) -> Engine:
+    """A sync engine on url with the pool settings, and the SQLite pragmas unless disabled"""
+    is_sqlite = url.startswith("sqlite")
+    db_engine = create_engine(
+        url,
+        connect_args={"check_same_thread": False} if is_sqlite else {},
+        **engine_options(url)
+    )
+    if is_sqlite and sqlite_pragmas:
+        event.listen(db_engine, "connect", set_sqlite_pragmas)
+    return db_engine
+
+# Create database engine, used by the CLI, batch jobs and worker threads
+engine = create_database_engine(DATABASE_URL)
 
 # Create SessionLocal class
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine for request handlers, its queries never block the event loop
+async_engine = create_async_engine(async_database_url(DATABASE_URL), **engine_options(DATABASE_URL))
+if DATABASE_URL.startswith("sqlite"):
+    event.listen(async_engine.sync_engine, "connect", set_sqlite_pragmas)
+
+# Objects stay readable after commit, an expired attribute would need a lazy load async code can't do
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 # Create Base class
 Base = declarative_base()
 
@@ -21,4 +82,9 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+# Dependency to get an async database session
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,79 @@
+"""Schema migrations for databases created before a model change
+
+create_all only creates missing tables, it never alters existing ones. Each
+migration here brings an older database up to the current models, and is
+written so it is a no-op on a database create_all has just built. Applied
+revisions are recorded in schema_migrations and never run twice.
+"""
+from datetime import datetime
+from typing import Callable, List, Tuple
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+import logging
+
+logger = logging.getLogger(__name__)
+
+def _add_columns(conn: Connection, table: str, columns: List[Tuple[str, str]]):
+    """ALTER TABLE ADD COLUMN for each (name, type) the table doesn't have yet"""
+    existing = {column["name"] for column in inspect(conn).get_columns(table)}
+    for name, column_type in columns:
+        if name not in existing:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {column_type}"))
+
+def _movie_details_columns(conn: Connection):
+    _add_columns(conn, "movies", [
+        ("runtime", "INTEGER"),
+        ("backdrop_path", "VARCHAR"),
+        ("details_fetched_at", "TIMESTAMP")
+    ])
+
+def _user_list_indexes(conn: Connection):
+    for name, table, columns in [
+        ("ix_watch_history_user_id_watched_at_id", "watch_history", "user_id, watched_at, id"),
+        ("ix_watchlists_user_id_added_at_id", "watchlists", "user_id, added_at, id"),
+        ("ix_ratings_user_id_updated_at_id", "ratings", "user_id, updated_at, id")
+    ]:
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})"))
+
+def _user_entry_unique_indexes(conn: Connection):
+    for name, table in [
+        ("uq_watch_history_user_id_movie_id", "watch_history"),
+        ("uq_watchlists_user_id_movie_id", "watchlists"),
+        ("uq_ratings_user_id_movie_id", "ratings")
+    ]:
+        # Concurrent check-then-insert writes could store a movie twice, keep the latest entry
+        conn.execute(text(
+            f"DELETE FROM {table} WHERE id NOT IN (SELECT MAX(id) FROM {table} GROUP BY user_id, movie_id)"
+        ))
+        conn.execute(text(f"CREATE UNIQUE INDEX IF NOT EXISTS {name} ON {table} (user_id, movie_id)"))
+
+# (revision, migration) in the order they must be applied
+MIGRATIONS: List[Tuple[str, Callable[[Connection], None]]] = [
+    ("0001_movie_details_columns", _movie_details_columns),
+    ("0002_user_list_indexes", _user_list_indexes),
+    ("0003_user_entry_unique_indexes", _user_entry_unique_indexes),
+]
+
+def run_migrations(engine: Engine) -> List[str]:
+    """Apply pending migrations, each in its own transaction, returns the revisions applied"""
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations (revision VARCHAR PRIMARY KEY, applied_at TIMESTAMP)"
+        ))
+        applied = {revision for (revision,) in conn.execute(text("SELECT revision FROM schema_migrations"))}
+
+    ran = []
+    for revision, migrate in MIGRATIONS:
+        if revision in applied:
+            continue
+
+        with engine.begin() as conn:
+            migrate(conn)
+            conn.execute(
+                text("INSERT INTO schema_migrations (revision, applied_at) VALUES (:revision, :applied_at)"),
+                {"revision": revision, "applied_at": datetime.now()}
+            )
+        logger.info(f"Applied migration {revision}")
+        ran.append(revision)
+
+    return ran
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, Table, DateTime
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, Table, DateTime, Index
 from sqlalchemy.orm import relationship
 from app.models.database import Base
 from datetime import datetime
@@ -24,10 +24,41 @@ class Movie(Base):
     vote_average = Column(Float)
     vote_count = Column(Integer)
     popularity = Column(Float)
+    runtime = Column(Integer)
+    backdrop_path = Column(String)
+    details_fetched_at = Column(DateTime)  # when full details were last read from TMDB, None if never
     
     # Relationships
     genres = relationship("Genre", secondary=movie_genre, back_populates="movies")
     viewers = relationship("User", secondary="user_movie", back_populates="watch_history")
+    
+    def to_dict(self):
+        """Serialize in the same shape as a TMDB movie list result"""
+        return {
+            "id": self.tmdb_id,
+            "title": self.title,
+            "overview": self.overview or "",
+            "poster_path": self.poster_path,
+            "release_date": self.release_date.strftime("%Y-%m-%d") if self.release_date else None,
+            "vote_average": self.vote_average,
+            "vote_count": self.vote_count,
+            "popularity": self.popularity,
+            "genre_ids": [genre.id for genre in self.genres]
+        }
+    
+    def to_details_dict(self):
+        """Serialize in the shape /movies/{movie_id} returns, the fields of a TMDB details response"""
+        return {
+            "id": self.tmdb_id,
+            "title": self.title,
+            "overview": self.overview,
+            "poster_path": self.poster_path,
+            "backdrop_path": self.backdrop_path,
+            "release_date": self.release_date.strftime("%Y-%m-%d") if self.release_date else None,
+            "runtime": self.runtime,
+            "vote_average": self.vote_average,
+            "genres": [{"id": genre.id, "name": genre.name} for genre in self.genres]
+        }
 
 class Genre(Base):
     __tablename__ = "genres"
@@ -41,6 +72,12 @@ class Genre(Base):
 
 class WatchHistory(Base):
     __tablename__ = "watch_history"
+    __table_args__ = (
+        # Keyset pagination of one user's entries, newest first
+        Index("ix_watch_history_user_id_watched_at_id", "user_id", "watched_at", "id"),
+        # One entry per user and movie, the conflict target of the upserts writing them
+        Index("uq_watch_history_user_id_movie_id", "user_id", "movie_id", unique=True),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -53,6 +90,12 @@ class WatchHistory(Base):
 
 class Watchlist(Base):
     __tablename__ = "watchlists"
+    __table_args__ = (
+        # Keyset pagination of one user's entries, newest first
+        Index("ix_watchlists_user_id_added_at_id", "user_id", "added_at", "id"),
+        # One entry per user and movie, the conflict target of the upserts writing them
+        Index("uq_watchlists_user_id_movie_id", "user_id", "movie_id", unique=True),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -65,6 +108,12 @@ class Watchlist(Base):
 
 class Rating(Base):
     __tablename__ = "ratings"
+    __table_args__ = (
+        # Keyset pagination of one user's entries, newest first
+        Index("ix_ratings_user_id_updated_at_id", "user_id", "updated_at", "id"),
+        # One entry per user and movie, the conflict target of the upserts writing them
+        Index("uq_ratings_user_id_movie_id", "user_id", "movie_id", unique=True),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -75,4 +124,18 @@ class Rating(Base):
     created_at = Column(DateTime, default=datetime.now)
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
     
-    user = relationship("User", back_populates="ratings_entries")
\ No newline at end of file
+    user = relationship("User", back_populates="ratings_entries")
+
+class UserRecommendation(Base):
+    __tablename__ = "user_recommendations"
+    __table_args__ = (
+        # Serving reads one user's list in rank order
+        Index("ix_user_recommendations_user_id_rank", "user_id", "rank"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    rank = Column(Integer, nullable=False)
+    movie_id = Column(Integer, ForeignKey("movies.id"), nullable=False)
+    model_version = Column(String)
+    generated_at = Column(DateTime, default=datetime.now)
\ No newline at end of file
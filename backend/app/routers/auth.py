@@ -1,13 +1,15 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.responses import JSONResponse
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, timedelta
 from typing import Optional
 from sqlalchemy import DateTime
-from app.models.database import get_db
+from app.models.database import get_async_db
 from app.models.user import User
 from app.utils.auth import create_access_token, get_current_user
+from app.utils.executors import run_blocking
 from app.schemas.schemas import UserCreate, UserResponse, Token
 from app.config import settings
 import logging
@@ -16,30 +18,32 @@ router = APIRouter(prefix="/auth", tags=["Authentication"])
 logger = logging.getLogger(__name__)
 
 @router.post("/register", response_model=UserResponse)
-def register(user_data: UserCreate, db: Session = Depends(get_db)):
+async def register(user_data: UserCreate, db: AsyncSession = Depends(get_async_db)):
     # Check if user exists
-    db_user = db.query(User).filter(User.email == user_data.email).first()
+    db_user = (await db.execute(select(User).where(User.email == user_data.email))).scalars().first()
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     
     # Create new user
     new_user = User(email=user_data.email, username=user_data.username)
-    new_user.set_password(user_data.password)
+    # bcrypt is deliberately slow, keep it off the event loop
+    await run_blocking(new_user.set_password, user_data.password)
     
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    # UserResponse reads relationships, which async sessions can't lazy load
+    await db.refresh(new_user, ["preferences", "watch_history"])
     
     return new_user
 
 @router.post("/login")
 async def login(
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     try:
-        user = db.query(User).filter(User.email == form_data.username).first()
-        if not user or not user.verify_password(form_data.password):
+        user = (await db.execute(select(User).where(User.email == form_data.username))).scalars().first()
+        if not user or not await run_blocking(user.verify_password, form_data.password):
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Incorrect email or password",
@@ -76,5 +80,6 @@ async def login(
         )
 
 @router.get("/me", response_model=UserResponse)
-def get_me(current_user: User = Depends(get_current_user)):
+async def get_me(current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    await db.refresh(current_user, ["preferences", "watch_history"])
     return current_user
\ No newline at end of file
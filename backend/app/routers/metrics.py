@@ -0,0 +1,22 @@
+from fastapi import APIRouter, Request
+from app.services.recommendation_service import recommendation_service
+from app.services.tmdb_service import tmdb_service
+from app.utils.executors import executor_stats
+
+router = APIRouter(prefix="/metrics", tags=["Metrics"])
+
+@router.get("/tmdb")
+async def get_tmdb_metrics():
+    """TMDB client cache, rate limiter and circuit breaker counters"""
+    return tmdb_service.stats()
+
+
+@router.get("/executors")
+async def get_executor_metrics(request: Request):
+    """Blocking thread pool and scoring process pool counters, and event loop stalls in debug"""
+    pool = recommendation_service.scoring_pool
+    stats = {**executor_stats(), "scoring": pool.stats() if pool is not None else None}
+    loop_monitor = getattr(request.app.state, "loop_monitor", None)
+    if loop_monitor is not None:
+        stats["loop"] = loop_monitor.stats()
+    return stats
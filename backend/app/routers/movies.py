@@ -1,11 +1,19 @@
 from fastapi import APIRouter, Depends, HTTPException, Query, Body
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from typing import List, Optional, Dict
-from app.models.database import get_db
+from app.models.database import get_async_db, get_db
 from app.models.user import User
 from app.models.movie import Movie, Genre
 from app.services.tmdb_service import tmdb_service
+from app.services.recommendation_service import recommendation_service
+from app.services.catalog_service import get_movie, has_fresh_details, save_movie_details, upsert_movies
+from app.services.search_service import search_service
+from app.services.text_index import TitleCompleter
+from app.config import settings
 from app.utils.auth import get_current_user
+from app.utils.executors import run_blocking
 from app.schemas.schemas import MovieResponse, GenreResponse
 from datetime import datetime
 import logging
@@ -13,52 +21,88 @@ import logging
 router = APIRouter(prefix="/movies", tags=["Movies"])
 logger = logging.getLogger(__name__)
 
+async def save_movies(db: AsyncSession, results: List[Dict]) -> List[Movie]:
+    """Upsert a page of TMDB results in one transaction, returns their rows in page order"""
+    result = await db.run_sync(upsert_movies, results)
+    movies = await db.run_sync(recommendation_service.load_movies_by_tmdb_id, [movie_data["id"] for movie_data in results])
+    
+    # Append new movies to the content index instead of refitting it
+    if result.inserted:
+        inserted = set(result.inserted)
+        await run_blocking(recommendation_service.add_movies, [movie for movie in movies if movie.id in inserted])
+    
+    return movies
+
+async def load_movie_details(db: AsyncSession, movie_id: int) -> Movie:
+    """Read-through lookup: the local row while its details are fresh, else fetched from TMDB and stored"""
+    db_movie = await db.run_sync(get_movie, movie_id)
+    if db_movie is not None and has_fresh_details(db_movie):
+        return db_movie
+    
+    try:
+        movie_data = await tmdb_service.get_movie_details(movie_id)
+    except Exception as e:
+        # Stale details beat an error while TMDB is unavailable
+        if db_movie is not None:
+            logger.warning(f"Serving stored details for movie {movie_id}, TMDB failed: {str(e)}")
+            return db_movie
+        raise
+    
+    db_movie, inserted = await db.run_sync(save_movie_details, movie_data)
+    if inserted:
+        await run_blocking(recommendation_service.add_movies, [db_movie])
+    return db_movie
+
+async def search_with_fallback(db: AsyncSession, query: str, page: int) -> Dict:
+    """Answer a search from the local index, asking TMDB only when it finds too little"""
+    local = await search_service.search(db, query, page, min_results=settings.search_min_local_results)
+    # Titles sharing only some of the words, such as a lone "the", don't count as an answer
+    if local is not None and local.all_words >= settings.search_min_local_results:
+        return {
+            "page": page,
+            "results": local.results,
+            "total_pages": -(-local.total_results // 20),
+            "total_results": local.total_results
+        }
+    
+    response = await tmdb_service.search_movies(query, page)
+    logger.info(f"Search response received with {len(response.get('results', []))} results")
+    
+    # Keep what TMDB found, so the next search for it is answered locally
+    try:
+        await save_movies(db, response.get("results", []))
+    except Exception as e:
+        await db.rollback()
+        logger.warning(f"Failed to save search results: {str(e)}")
+    
+    # Filter out movies without poster path
+    filtered_results = [
+        movie for movie in response.get("results", [])
+        if movie.get("poster_path")
+    ]
+    
+    return {
+        "page": response.get("page", 1),
+        "results": filtered_results,
+        "total_pages": response.get("total_pages", 1),
+        "total_results": response.get("total_results", 0)
+    }
+
 @router.get("/popular", response_model=List[MovieResponse])
 async def get_popular_movies(
     page: int = Query(1, ge=1), 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Get popular movies from TMDB"""
-    response = tmdb_service.get_popular_movies(page)
-    
-    # Process and save movies to the database
-    movies = []
-    for movie_data in response.get("results", []):
-        # Check if movie exists in database
-        db_movie = db.query(Movie).filter(Movie.tmdb_id == movie_data["id"]).first()
-        
-        if not db_movie:
-            # Create new movie record
-            db_movie = Movie(
-                tmdb_id=movie_data["id"],
-                title=movie_data["title"],
-                overview=movie_data["overview"],
-                release_date=datetime.strptime(movie_data["release_date"], "%Y-%m-%d") if movie_data.get("release_date") else None,
-                poster_path=movie_data["poster_path"],
-                vote_average=movie_data["vote_average"],
-                vote_count=movie_data["vote_count"],
-                popularity=movie_data["popularity"],
-            )
-            
-            # Add genres
-            for genre_id in movie_data.get("genre_ids", []):
-                genre = db.query(Genre).filter(Genre.id == genre_id).first()
-                if genre:
-                    db_movie.genres.append(genre)
-                    
-            db.add(db_movie)
-            db.commit()
-            db.refresh(db_movie)
-        
-        movies.append(db_movie)
-    
-    return movies
+    response = await tmdb_service.get_popular_movies(page)
+    return await save_movies(db, response.get("results", []))
 
 @router.get("/search")
 async def search_movies(
     query: str = Query(...),  # Make it required
-    page: int = Query(1, ge=1)
+    page: int = Query(1, ge=1),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Search for movies by title"""
     try:
@@ -74,73 +118,49 @@ async def search_movies(
                 "total_results": 0
             }
             
-        response = tmdb_service.search_movies(query.strip(), page)
-        logger.info(f"Search response received with {len(response.get('results', []))} results")
-        
-        # Filter out movies without poster path
-        filtered_results = [
-            movie for movie in response.get("results", [])
-            if movie.get("poster_path")
-        ]
-        
-        return {
-            "page": response.get("page", 1),
-            "results": filtered_results,
-            "total_pages": response.get("total_pages", 1),
-            "total_results": response.get("total_results", 0)
-        }
+        return await search_with_fallback(db, query.strip(), page)
         
     except Exception as e:
         logger.error(f"Error searching movies: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/genres", response_model=List[GenreResponse])
-async def get_genres(db: Session = Depends(get_db)):
+async def get_genres(db: AsyncSession = Depends(get_async_db)):
     """Get all movie genres"""
-    genres = db.query(Genre).all()
+    genres = (await db.execute(select(Genre))).scalars().all()
     
     if not genres:
         # If genres don't exist in the database, fetch from TMDB API
-        response = tmdb_service.get_movie_genres()
+        response = await tmdb_service.get_movie_genres()
         
         for genre_data in response.get("genres", []):
             genre = Genre(id=genre_data["id"], name=genre_data["name"])
             db.add(genre)
         
-        db.commit()
-        genres = db.query(Genre).all()
+        await db.commit()
+        genres = (await db.execute(select(Genre))).scalars().all()
     
     return genres
 
 @router.get("/{movie_id}", response_model=MovieResponse)
 async def get_movie_details(
     movie_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Get detailed information about a specific movie"""
-    # Check if movie exists in database
-    db_movie = db.query(Movie).filter(Movie.tmdb_id == movie_id).first()
-    
-    if not db_movie:
-        # If not in database, fetch from TMDB API
-        movie_data = tmdb_service.get_movie_details(movie_id)
-        
-        # Create new movie record (similar to popular movies)
-        # ...
-        
-    return db_movie
+    return await load_movie_details(db, movie_id)
 
 @router.post("/{movie_id}/rate", response_model=dict)
 async def rate_movie(
     movie_id: int,
     rating: int = Query(..., ge=1, le=10),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Rate a movie (1-10 scale)"""
     # Check if movie exists in database
-    db_movie = db.query(Movie).filter(Movie.tmdb_id == movie_id).first()
+    db_movie = (await db.execute(select(Movie).where(Movie.tmdb_id == movie_id))).scalars().first()
     
     if not db_movie:
         raise HTTPException(status_code=404, detail="Movie not found")
@@ -190,39 +210,47 @@ from ..services.tmdb_service import tmdb_service
 router = APIRouter(prefix="/movies", tags=["movies"])
 
 @router.get("/popular")
-async def get_popular_movies(page: int = 1):
+async def get_popular_movies(page: int = 1, db: AsyncSession = Depends(get_async_db)):
     try:
-        print(f"Fetching popular movies for page {page}")
-        response = tmdb_service.get_popular_movies(page)
-        print(f"TMDB Response: {response}")
+        logger.info(f"Fetching popular movies for page {page}")
+        response = await tmdb_service.get_popular_movies(page)
+        logger.info(f"Popular movies response received with {len(response.get('results', []))} results")
+        
+        # Grow the local catalog, serving the page doesn't depend on it
+        try:
+            await save_movies(db, response.get("results", []))
+        except Exception as e:
+            await db.rollback()
+            logger.warning(f"Failed to save popular movies: {str(e)}")
         
         # Return only the results array
         return {
             "movies": response.get("results", [])
         }
     except Exception as e:
-        print(f"Error in get_popular_movies: {str(e)}")
+        logger.error(f"Error in get_popular_movies: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/genres")
 async def get_genres():
     try:
-        print("Fetching movie genres")
-        response = tmdb_service.get_movie_genres()
-        print(f"TMDB Genres Response: {response}")
+        logger.info("Fetching movie genres")
+        response = await tmdb_service.get_movie_genres()
+        logger.info(f"Genres response received with {len(response.get('genres', []))} genres")
         
         # Return only the genres array
         return {
             "genres": response.get("genres", [])
         }
     except Exception as e:
-        print(f"Error in get_genres: {str(e)}")
+        logger.error(f"Error in get_genres: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/search")
 async def search_movies(
     query: str = Query(...),  # Make it required
-    page: int = Query(1, ge=1)
+    page: int = Query(1, ge=1),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Search for movies by title"""
     try:
@@ -238,26 +266,26 @@ async def search_movies(
                 "total_results": 0
             }
             
-        response = tmdb_service.search_movies(query.strip(), page)
-        logger.info(f"Search response received with {len(response.get('results', []))} results")
-        
-        # Filter out movies without poster path
-        filtered_results = [
-            movie for movie in response.get("results", [])
-            if movie.get("poster_path")
-        ]
-        
-        return {
-            "page": response.get("page", 1),
-            "results": filtered_results,
-            "total_pages": response.get("total_pages", 1),
-            "total_results": response.get("total_results", 0)
-        }
+        return await search_with_fallback(db, query.strip(), page)
         
     except Exception as e:
         logger.error(f"Error searching movies: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/autocomplete")
+async def autocomplete_movies(
+    query: str = Query(...),
+    limit: int = Query(10, ge=1, le=TitleCompleter.TOP_K),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Suggest titles for a search being typed, from the local catalog only"""
+    try:
+        suggestions = await search_service.autocomplete(db, query, limit)
+        return {"results": [suggestion._asdict() for suggestion in suggestions or []]}
+    except Exception as e:
+        logger.error(f"Error autocompleting '{query}': {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.get("/genre/{genre_id}")
 async def get_movies_by_genre(
     genre_id: int,
@@ -266,8 +294,8 @@ async def get_movies_by_genre(
     try:
         logger.info(f"Fetching movies for genre {genre_id}, page {page}")
         
-        # Get movies from TMDB API - remove await since _make_request is not async
-        response = tmdb_service.discover_movies({
+        # Get movies from TMDB API
+        response = await tmdb_service.discover_movies({
             "with_genres": genre_id,
             "page": page,
             "sort_by": "popularity.desc"
@@ -288,26 +316,14 @@ async def test_endpoint():
     return {"status": "ok", "message": "API is working"}
 
 @router.get("/{movie_id}")
-async def get_movie_details(movie_id: int):
+async def get_movie_details(movie_id: int, db: AsyncSession = Depends(get_async_db)):
     try:
         logger.info(f"Fetching details for movie: {movie_id}")
-        # Get movie details directly from TMDB
-        response = tmdb_service.get_movie_details(movie_id)
-        print(f"TMDB Movie Details Response: {response}")
-
-        # Transform response to match frontend expectations
-        movie_details = {
-            "id": response.get("id"),
-            "title": response.get("title"),
-            "overview": response.get("overview"),
-            "poster_path": response.get("poster_path"),
-            "backdrop_path": response.get("backdrop_path"),
-            "release_date": response.get("release_date"),
-            "runtime": response.get("runtime"),
-            "vote_average": response.get("vote_average"),
-            "genres": response.get("genres", [])
-        }
-        return movie_details
+        # Served from the local catalog, TMDB is only asked when the details are missing or stale
+        movie = await load_movie_details(db, movie_id)
+        
+        # Same fields as the TMDB details response the frontend expects
+        return movie.to_details_dict()
     except Exception as e:
         logger.error(f"Error in get_movie_details: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -316,14 +332,26 @@ async def get_movie_details(movie_id: int):
 async def get_similar_movies(
     movie_id: int,
     limit: int = Query(8, ge=1, le=20),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)  # Add auth requirement
 ):
     """Get similar movies based on a movie ID"""
     try:
         logger.info(f"Getting similar movies for movie_id: {movie_id}, limit: {limit}")
         
+        # Answer from the local nearest-neighbour index when it knows the movie
+        similar_ids = await run_blocking(recommendation_service.similar_movies, movie_id, limit * 2)
+        if similar_ids:
+            movies = [
+                movie.to_dict()
+                for movie in await db.run_sync(recommendation_service.load_movies_by_tmdb_id, similar_ids)
+                if movie.poster_path and movie.release_date
+            ][:limit]
+            if movies:
+                return {"movies": movies}
+        
         # Call TMDB service to get similar movies
-        response = tmdb_service.get_similar_movies(movie_id)
+        response = await tmdb_service.get_similar_movies(movie_id)
         
         if not response or "results" not in response:
             logger.warning(f"No similar movies found for movie_id: {movie_id}")
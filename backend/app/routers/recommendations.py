@@ -1,47 +1,70 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
-from typing import List
-from app.models.database import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+from app.models.database import SessionLocal, get_async_db
 from app.models.user import User
 from app.models.movie import Movie
 from app.services.tmdb_service import tmdb_service
-from app.services.recommendation_service import RecommendationService
+from app.services.recommendation_service import recommendation_service
 from app.utils.auth import get_current_user
+from app.utils.executors import run_blocking
 from app.schemas.schemas import MovieResponse
 import logging
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/recommendations", tags=["Recommendations"])
-recommendation_service = RecommendationService()
+
+def personalized_movies(user_id: int, limit: int) -> Optional[List[Movie]]:
+    """Recommendations for a user with a watch history, None without one
+    
+    Scoring is blocking work, so it runs on a worker thread with its own
+    session rather than the request's async one.
+    """
+    db = SessionLocal()
+    try:
+        user = db.get(User, user_id)
+        if not user.watch_history:
+            return None
+        return recommendation_service.get_cached_recommendations(user, limit, db)
+    finally:
+        db.close()
 
 @router.get("/personalized", response_model=List[MovieResponse])
 async def get_personalized_recommendations(
     limit: int = Query(10, ge=1, le=100),
-    db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """Get personalized movie recommendations based on user preferences and watch history"""
+    # Get recommendations based on user's watch history and preferences, scoring runs off the loop
+    recommended_movies = await run_blocking(personalized_movies, current_user.id, limit)
+    
     # If user has no watch history, return popular movies
-    if not current_user.watch_history:
-        response = tmdb_service.get_popular_movies()
+    if recommended_movies is None:
+        response = await tmdb_service.get_popular_movies()
         return response.get("results", [])[:limit]
     
-    # Get recommendations based on user's watch history and preferences
-    recommended_movies = recommendation_service.get_recommendations_for_user(current_user, limit, db)
-    
     return recommended_movies
 
 @router.get("/similar/{movie_id}", response_model=List[MovieResponse])
 async def get_similar_movies(
     movie_id: int,
     limit: int = Query(8, ge=1, le=20),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Get movies similar to the specified movie by genre"""
+    """Get movies similar to the specified movie"""
     try:
+        # Answer from the local nearest-neighbour index when it knows the movie
+        similar_ids = await run_blocking(recommendation_service.similar_movies, movie_id, limit)
+        if similar_ids:
+            return [
+                MovieResponse(tmdb_id=movie.tmdb_id, **movie.to_dict())
+                for movie in await db.run_sync(recommendation_service.load_movies_by_tmdb_id, similar_ids)
+            ]
+        
+        # Otherwise fall back to TMDB and find movies from the same genres
         # Get movie details to find its genres
-        movie_details = tmdb_service.get_movie_details(movie_id)  # Remove await
+        movie_details = await tmdb_service.get_movie_details(movie_id)
         if not movie_details:
             raise HTTPException(status_code=404, detail="Movie not found")
 
@@ -57,7 +80,7 @@ async def get_similar_movies(
             "page": 1
         }
         
-        response = tmdb_service.discover_movies(discover_params)
+        response = await tmdb_service.discover_movies(discover_params)
         movies = response.get("results", [])
 
         # Filter out the original movie and format response
@@ -89,12 +112,12 @@ async def get_similar_movies(
 async def get_recommendations_by_genre(
     genre_id: int,
     page: int = Query(1, ge=1),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Get movie recommendations for a specific genre"""
     # Use the discover endpoint to get movies by genre
-    response = tmdb_service.discover_movies({
+    response = await tmdb_service.discover_movies({
         "with_genres": genre_id,
         "sort_by": "popularity.desc",
         "page": page
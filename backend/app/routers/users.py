@@ -1,10 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query
-from sqlalchemy.orm import Session
-from app.models.database import get_db
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, UploadFile, File, Form, Query
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.database import AsyncSessionLocal, get_async_db
 from app.models.user import User
 from app.models.movie import WatchHistory, Watchlist, Rating
 from app.utils.auth import get_current_user
+from app.utils.pagination import InvalidCursor, keyset_page
+from app.utils.executors import run_blocking
 from app.services.tmdb_service import tmdb_service
+from app.services.recommendation_service import recommendation_service
+from app.services.catalog_service import fill_entry_metadata, get_movie_metadata, save_movie_details
 from typing import Optional, List
 import os
 import shutil
@@ -25,7 +31,7 @@ os.makedirs(UPLOAD_DIR, exist_ok=True)
 async def upload_avatar(
     avatar: UploadFile = File(...),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     try:
         # Validate file size (5MB max)
@@ -52,13 +58,15 @@ async def upload_avatar(
         file_path = os.path.join(UPLOAD_DIR, unique_filename)
         
         # Save file
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(avatar.file, buffer)
+        def save_file():
+            with open(file_path, "wb") as buffer:
+                shutil.copyfileobj(avatar.file, buffer)
+        await run_blocking(save_file)
         
         # Update user's avatar URL in database
         avatar_url = f"{BASE_URL}/uploads/avatars/{unique_filename}"
         current_user.avatar_url = avatar_url
-        db.commit()
+        await db.commit()
         
         return {"url": avatar_url}
         
@@ -73,7 +81,7 @@ async def update_profile(
     username: Optional[str] = Form(None),
     email: Optional[str] = Form(None),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     try:
         logger.info(f"Updating profile for user {current_user.id}")
@@ -87,20 +95,19 @@ async def update_profile(
             logger.info(f"Updated avatar_url to: {avatar}")
         
         if username and username != current_user.username:
-            if db.query(User).filter(User.username == username, User.id != current_user.id).first():
+            if (await db.execute(select(User.id).where(User.username == username, User.id != current_user.id))).first():
                 raise HTTPException(status_code=400, detail="Username already taken")
             current_user.username = username
             changes_made = True
             
         if email and email != current_user.email:
-            if db.query(User).filter(User.email == email, User.id != current_user.id).first():
+            if (await db.execute(select(User.id).where(User.email == email, User.id != current_user.id))).first():
                 raise HTTPException(status_code=400, detail="Email already taken")
             current_user.email = email
             changes_made = True
             
         if changes_made:
-            db.commit()
-            db.refresh(current_user)
+            await db.commit()
             
         return {
             "id": current_user.id,
@@ -111,7 +118,7 @@ async def update_profile(
         
     except Exception as e:
         logger.error(f"Error updating profile: {str(e)}")
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/avatars")
@@ -128,74 +135,104 @@ async def get_avatars():
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+async def enrich_entries(movie_id: int):
+    """Fetch a movie the catalog lacks, then fill in the user entries saved without its title"""
+    try:
+        movie_data = await tmdb_service.get_movie_details(movie_id)
+    except Exception as e:
+        logger.warning(f"Failed to fetch details of movie {movie_id}, its entries stay untitled: {str(e)}")
+        return
+    
+    async with AsyncSessionLocal() as db:
+        try:
+            movie, inserted = await db.run_sync(save_movie_details, movie_data)
+            await db.run_sync(fill_entry_metadata, movie_id, movie.title, movie.poster_path)
+            if inserted:
+                await run_blocking(recommendation_service.add_movies, [movie])
+        except Exception as e:
+            await db.rollback()
+            logger.error(f"Error enriching entries of movie {movie_id}: {str(e)}")
+
+async def entry_metadata(db: AsyncSession, movie_id: int, background_tasks: BackgroundTasks) -> dict:
+    """Title and poster for a new user entry from the local catalog
+    
+    A movie the catalog doesn't have yet is saved without them, and fetched
+    from TMDB after the response, so writes never wait on the network.
+    """
+    metadata = await db.run_sync(get_movie_metadata, movie_id)
+    if metadata is None:
+        background_tasks.add_task(enrich_entries, movie_id)
+        return {"title": None, "poster_path": None}
+    return {"title": metadata.title, "poster_path": metadata.poster_path}
+
+def entry_insert(db: AsyncSession, model):
+    """INSERT of the session's dialect, both support ON CONFLICT on the (user_id, movie_id) unique index"""
+    return (postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert)(model)
+
+def upsert_entry(db: AsyncSession, model, values: dict, update_columns: List[str]):
+    """INSERT ... ON CONFLICT DO UPDATE of one user entry
+    
+    A single statement, so concurrent writes of the same movie can't both
+    insert it. An existing entry takes update_columns from values, and a
+    title and poster only where it has none yet.
+    """
+    statement = entry_insert(db, model).values(**values)
+    return statement.on_conflict_do_update(
+        index_elements=[model.user_id, model.movie_id],
+        set_={
+            **{column: statement.excluded[column] for column in update_columns},
+            "title": func.coalesce(model.title, statement.excluded.title),
+            "poster_path": func.coalesce(model.poster_path, statement.excluded.poster_path)
+        }
+    )
+
 # Watch history endpoints
 @router.post("/watch-history")
 async def add_to_watch_history(
     movie_data: schemas.MovieHistoryCreate,
-    db: Session = Depends(get_db),
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Add a movie to user's watch history"""
+    """Add a movie to user's watch history, or move it to the top if it is already there"""
     try:
         movie_id = movie_data.movie_id
         
-        # Check if already in watch history
-        existing = db.query(WatchHistory).filter(
-            WatchHistory.user_id == current_user.id,
-            WatchHistory.movie_id == movie_id
-        ).first()
+        await db.execute(upsert_entry(db, WatchHistory, {
+            "user_id": current_user.id,
+            "movie_id": movie_id,
+            **await entry_metadata(db, movie_id, background_tasks),
+            "watched_at": datetime.now()
+        }, ["watched_at"]))
+        await db.commit()
         
-        if existing:
-            # Update timestamp only
-            existing.watched_at = datetime.now()
-            db.commit()
-            return {"success": True, "message": "Updated watch history timestamp"}
-        
-        # Check if movie exists in TMDB
-        try:
-            movie_details = tmdb_service.get_movie_details(movie_id)
-        except Exception as e:
-            logger.error(f"Failed to fetch movie details: {e}")
-            raise HTTPException(status_code=404, detail=f"Movie not found: {str(e)}")
-        
-        # Create new watch history entry
-        watch_history = WatchHistory(
-            user_id=current_user.id,
-            movie_id=movie_id,
-            title=movie_details.get("title", "Unknown"),
-            poster_path=movie_details.get("poster_path"),
-            watched_at=datetime.now()
-        )
-        
-        db.add(watch_history)
-        db.commit()
-        
-        return {"success": True, "message": "Added to watch history"}
+        background_tasks.add_task(recommendation_service.invalidate_user, current_user.id)
+        return {"success": True, "message": "Saved to watch history"}
         
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"Error adding to watch history: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/watch-history")
 async def get_watch_history(
     limit: int = Query(10, ge=1, le=50),
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = Query(None),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Get user's watch history"""
+    """Get user's watch history, newest first, pass next_cursor back for the next page"""
     try:
-        history = db.query(WatchHistory).filter(
-            WatchHistory.user_id == current_user.id
-        ).order_by(
-            WatchHistory.watched_at.desc()
-        ).limit(limit).all()
+        page = await keyset_page(
+            db, select(WatchHistory).where(WatchHistory.user_id == current_user.id),
+            WatchHistory.watched_at, WatchHistory.id, cursor, limit
+        )
         
         # Transform to response format
         history_list = []
-        for entry in history:
+        for entry in page.items:
             history_list.append({
                 "id": entry.movie_id,
                 "tmdb_id": entry.movie_id,
@@ -204,8 +241,10 @@ async def get_watch_history(
                 "watched_at": entry.watched_at.isoformat()
             })
             
-        return {"history": history_list}
+        return {"history": history_list, "next_cursor": page.next_cursor}
         
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error retrieving watch history: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -214,69 +253,60 @@ async def get_watch_history(
 @router.post("/watch-list/toggle")
 async def toggle_watchlist(
     movie_data: schemas.WatchlistCreate,
-    db: Session = Depends(get_db),
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Add or remove a movie from user's watchlist"""
     try:
         movie_id = movie_data.movie_id
         
-        # Check if movie is already in watchlist
-        existing = db.query(Watchlist).filter(
+        # Remove from watchlist if it is there
+        removed = await db.execute(delete(Watchlist).where(
             Watchlist.user_id == current_user.id,
             Watchlist.movie_id == movie_id
-        ).first()
-        
-        if existing:
-            # Remove from watchlist
-            db.delete(existing)
-            db.commit()
+        ))
+        if removed.rowcount:
+            await db.commit()
+            background_tasks.add_task(recommendation_service.invalidate_user, current_user.id)
             return {"success": True, "in_watchlist": False, "message": "Removed from watchlist"}
         
-        # Get movie details from TMDB
-        try:
-            movie_details = tmdb_service.get_movie_details(movie_id)
-        except Exception as e:
-            logger.error(f"Failed to fetch movie details: {e}")
-            raise HTTPException(status_code=404, detail=f"Movie not found: {str(e)}")
-        
-        # Add to watchlist
-        watchlist_item = Watchlist(
+        # Add to watchlist, a concurrent toggle that added it first wins
+        await db.execute(entry_insert(db, Watchlist).values(
             user_id=current_user.id,
             movie_id=movie_id,
-            title=movie_details.get("title", "Unknown"),
-            poster_path=movie_details.get("poster_path"),
+            **await entry_metadata(db, movie_id, background_tasks),
             added_at=datetime.now()
-        )
-        
-        db.add(watchlist_item)
-        db.commit()
+        ).on_conflict_do_nothing(index_elements=[Watchlist.user_id, Watchlist.movie_id]))
+        await db.commit()
         
+        background_tasks.add_task(recommendation_service.invalidate_user, current_user.id)
         return {"success": True, "in_watchlist": True, "message": "Added to watchlist"}
         
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"Error toggling watchlist: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/watch-list")
 async def get_watchlist(
-    db: Session = Depends(get_db),
+    limit: int = Query(50, ge=1, le=100),
+    cursor: Optional[str] = Query(None),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Get user's watchlist"""
+    """Get user's watchlist, newest first, pass next_cursor back for the next page"""
     try:
-        watchlist = db.query(Watchlist).filter(
-            Watchlist.user_id == current_user.id
-        ).order_by(
-            Watchlist.added_at.desc()
-        ).all()
+        page = await keyset_page(
+            db, select(Watchlist).where(Watchlist.user_id == current_user.id),
+            Watchlist.added_at, Watchlist.id, cursor, limit
+        )
         
         # Transform to response format
         watchlist_items = []
-        for item in watchlist:
+        for item in page.items:
             watchlist_items.append({
                 "id": item.movie_id,
                 "tmdb_id": item.movie_id,
@@ -285,8 +315,10 @@ async def get_watchlist(
                 "added_at": item.added_at.isoformat()
             })
             
-        return {"watchlist": watchlist_items}
+        return {"watchlist": watchlist_items, "next_cursor": page.next_cursor}
         
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error retrieving watchlist: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -295,7 +327,8 @@ async def get_watchlist(
 @router.post("/ratings")
 async def rate_movie(
     rating_data: schemas.RatingCreate,
-    db: Session = Depends(get_db),
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Rate a movie"""
@@ -305,60 +338,74 @@ async def rate_movie(
             
         movie_id = rating_data.movie_id
         
-        # Check if user has already rated this movie
-        existing_rating = db.query(Rating).filter(
-            Rating.user_id == current_user.id,
-            Rating.movie_id == movie_id
-        ).first()
-        
-        if existing_rating:
-            # Update existing rating
-            existing_rating.rating = rating_data.rating
-            existing_rating.updated_at = datetime.now()
-            db.commit()
-            return {"success": True, "message": "Rating updated"}
-            
-        # Get movie details from TMDB
-        try:
-            movie_details = tmdb_service.get_movie_details(movie_id)
-        except Exception as e:
-            logger.error(f"Failed to fetch movie details: {e}")
-            raise HTTPException(status_code=404, detail=f"Movie not found: {str(e)}")
-            
-        # Create new rating
-        new_rating = Rating(
-            user_id=current_user.id,
-            movie_id=movie_id,
-            rating=rating_data.rating,
-            title=movie_details.get("title", "Unknown"),
-            poster_path=movie_details.get("poster_path"),
-            created_at=datetime.now()
-        )
-        
-        db.add(new_rating)
-        db.commit()
-        
-        return {"success": True, "message": "Rating added"}
+        # Add the rating, or replace the user's earlier one
+        now = datetime.now()
+        await db.execute(upsert_entry(db, Rating, {
+            "user_id": current_user.id,
+            "movie_id": movie_id,
+            "rating": rating_data.rating,
+            **await entry_metadata(db, movie_id, background_tasks),
+            "created_at": now,
+            "updated_at": now
+        }, ["rating", "updated_at"]))
+        await db.commit()
+        
+        background_tasks.add_task(recommendation_service.invalidate_user, current_user.id)
+        return {"success": True, "message": "Rating saved"}
         
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"Error rating movie: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/ratings")
+async def get_ratings(
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Get user's ratings, most recently rated first, pass next_cursor back for the next page"""
+    try:
+        page = await keyset_page(
+            db, select(Rating).where(Rating.user_id == current_user.id),
+            Rating.updated_at, Rating.id, cursor, limit
+        )
+        
+        ratings = [
+            {
+                "id": rating.movie_id,
+                "tmdb_id": rating.movie_id,
+                "title": rating.title,
+                "poster_path": rating.poster_path,
+                "rating": rating.rating,
+                "updated_at": rating.updated_at.isoformat()
+            }
+            for rating in page.items
+        ]
+        
+        return {"ratings": ratings, "next_cursor": page.next_cursor}
+        
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error retrieving ratings: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.get("/ratings/{movie_id}")
 async def get_movie_rating(
     movie_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Get user's rating for a specific movie"""
     try:
-        rating = db.query(Rating).filter(
+        rating = (await db.execute(select(Rating).where(
             Rating.user_id == current_user.id,
             Rating.movie_id == movie_id
-        ).first()
+        ))).scalars().first()
         
         if not rating:
             return {"rating": None}
@@ -0,0 +1,170 @@
+import copy
+import os
+import numpy as np
+from typing import List, Optional
+from app.utils.ranking import top_k_indices
+import logging
+
+logger = logging.getLogger(__name__)
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+def _assign(vectors: np.ndarray, centroids: np.ndarray, chunk_size: int = 8192) -> np.ndarray:
+    """Nearest centroid by cosine for every vector, in chunks to bound memory"""
+    assignments = np.empty(vectors.shape[0], dtype=np.int64)
+    for start in range(0, vectors.shape[0], chunk_size):
+        assignments[start:start + chunk_size] = np.argmax(vectors[start:start + chunk_size] @ centroids.T, axis=1)
+    return assignments
+
+def spherical_kmeans(vectors: np.ndarray, n_clusters: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """Cluster unit vectors by cosine similarity, returns unit-length centroids"""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(vectors.shape[0], n_clusters, replace=False)].copy()
+
+    for _ in range(iterations):
+        assignments = _assign(vectors, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+
+        # Re-seed empty clusters from random vectors so no list goes unused
+        empty = ~np.any(sums, axis=1)
+        if empty.any():
+            sums[empty] = vectors[rng.choice(vectors.shape[0], int(empty.sum()), replace=False)]
+        centroids = _normalize(sums)
+
+    return centroids
+
+class IVFIndex:
+    """Inverted-file approximate nearest-neighbour index over unit-length embeddings
+
+    Vectors are bucketed by their nearest k-means centroid. A query only scores
+    the vectors in the nprobe buckets closest to it. All arrays are plain .npy
+    files so the index can be memory-mapped instead of read into RAM.
+
+    Vectors added after the build go to a small delta segment that is always
+    searched exactly, until the next full build folds them into the lists.
+    """
+
+    FILES = ("embeddings", "ids", "centroids", "list_offsets", "list_rows", "sorted_ids", "sorted_rows")
+
+    def __init__(self):
+        self.embeddings = None  # row -> unit vector
+        self.ids = None  # row -> tmdb id
+        self.centroids = None  # list -> unit centroid
+        self.list_offsets = None  # list -> start of its rows in list_rows
+        self.list_rows = None  # rows grouped by list
+        self.sorted_ids = None  # tmdb ids sorted, for id -> row lookups with searchsorted
+        self.sorted_rows = None  # row of each entry in sorted_ids
+        self.delta_embeddings = None  # unit vectors added since the build
+        self.delta_ids = None  # ids of the delta vectors
+
+    @classmethod
+    def build(cls, embeddings: np.ndarray, ids, n_lists: Optional[int] = None, seed: int = 0) -> "IVFIndex":
+        """Cluster the embeddings and build the inverted lists"""
+        index = cls()
+        index.embeddings = _normalize(np.asarray(embeddings, dtype=np.float32))
+        index.ids = np.asarray(ids, dtype=np.int64)
+
+        # sqrt(N) lists keeps both the centroid scan and the probed lists small
+        n_lists = n_lists or max(1, int(np.sqrt(index.embeddings.shape[0])))
+        n_lists = min(n_lists, index.embeddings.shape[0])
+        index.centroids = spherical_kmeans(index.embeddings, n_lists, seed=seed)
+
+        assignments = _assign(index.embeddings, index.centroids)
+        index.list_rows = np.argsort(assignments, kind="stable")
+        index.list_offsets = np.searchsorted(assignments[index.list_rows], np.arange(n_lists + 1))
+
+        index.sorted_rows = np.argsort(index.ids, kind="stable")
+        index.sorted_ids = index.ids[index.sorted_rows]
+        return index
+
+    def save(self, index_dir: str):
+        """Write the index to disk, replacing any previous version file by file"""
+        os.makedirs(index_dir, exist_ok=True)
+        for name in self.FILES:
+            path = os.path.join(index_dir, f"{name}.npy")
+            with open(path + ".tmp", "wb") as f:
+                np.save(f, getattr(self, name))
+            os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, index_dir: str, mmap: bool = True) -> Optional["IVFIndex"]:
+        """Load an index from disk, memory-mapped by default, returns None if there is none"""
+        paths = [os.path.join(index_dir, f"{name}.npy") for name in cls.FILES]
+        if not all(os.path.exists(path) for path in paths):
+            return None
+
+        index = cls()
+        for name, path in zip(cls.FILES, paths):
+            setattr(index, name, np.load(path, mmap_mode="r" if mmap else None))
+        return index
+
+    def __len__(self) -> int:
+        size = 0 if self.ids is None else self.ids.shape[0]
+        return size + (0 if self.delta_ids is None else self.delta_ids.shape[0])
+
+    def add(self, embeddings: np.ndarray, ids) -> "IVFIndex":
+        """Return a copy of the index with extra vectors in its delta segment
+
+        The built lists are shared with the copy, so this costs O(delta) and
+        readers of the original index are never affected.
+        """
+        index = copy.copy(self)
+        embeddings = _normalize(np.asarray(embeddings, dtype=np.float32))
+        ids = np.asarray(ids, dtype=np.int64)
+
+        if self.delta_ids is None:
+            index.delta_embeddings, index.delta_ids = embeddings, ids
+        else:
+            index.delta_embeddings = np.vstack([self.delta_embeddings, embeddings])
+            index.delta_ids = np.concatenate([self.delta_ids, ids])
+        return index
+
+    def row_for_id(self, item_id: int) -> Optional[int]:
+        """Row of an id in the built lists, or None if the lists don't have it"""
+        position = np.searchsorted(self.sorted_ids, item_id)
+        if position < len(self.sorted_ids) and self.sorted_ids[position] == item_id:
+            return int(self.sorted_rows[position])
+        return None
+
+    def vector_for_id(self, item_id: int) -> Optional[np.ndarray]:
+        """Embedding of an id, or None if the index doesn't know it"""
+        row = self.row_for_id(item_id)
+        if row is not None:
+            return np.asarray(self.embeddings[row])
+
+        if self.delta_ids is not None:
+            hits = np.flatnonzero(self.delta_ids == item_id)
+            if len(hits):
+                return self.delta_embeddings[hits[0]]
+        return None
+
+    def search(self, query: np.ndarray, k: int, nprobe: int = 8, exclude_ids=None) -> np.ndarray:
+        """Approximate top-k ids by cosine similarity to a unit-length query"""
+        probe = top_k_indices(self.centroids @ query, nprobe)
+        candidates = np.concatenate([
+            self.list_rows[self.list_offsets[c]:self.list_offsets[c + 1]] for c in probe
+        ])
+        ids = self.ids[candidates]
+        scores = self.embeddings[candidates] @ query
+
+        # The delta segment is small, so it is always scored exactly
+        if self.delta_ids is not None:
+            ids = np.concatenate([ids, self.delta_ids])
+            scores = np.concatenate([scores, self.delta_embeddings @ query])
+
+        if exclude_ids is not None:
+            keep = ~np.isin(ids, exclude_ids)
+            ids, scores = ids[keep], scores[keep]
+
+        return ids[top_k_indices(scores, k)]
+
+    def similar(self, item_id: int, k: int, nprobe: int = 8) -> Optional[List[int]]:
+        """Ids of the k items most similar to item_id, or None if the id is unknown"""
+        query = self.vector_for_id(item_id)
+        if query is None:
+            return None
+
+        return [int(i) for i in self.search(query, k, nprobe=nprobe, exclude_ids=[item_id])]
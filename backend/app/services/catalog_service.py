@@ -0,0 +1,213 @@
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+from sqlalchemy import insert, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session, joinedload
+from app.config import settings
+from app.models.movie import Genre, Movie, Rating, WatchHistory, Watchlist, movie_genre
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Movie columns filled from TMDB payloads
+MOVIE_FIELDS = (
+    "title", "overview", "release_date", "poster_path", "backdrop_path",
+    "vote_average", "vote_count", "popularity", "runtime"
+)
+
+class UpsertResult(NamedTuple):
+    """Outcome of an upsert, both lists hold Movie.id"""
+    inserted: List[int]
+    updated: List[int]
+
+def _parse_date(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, "%Y-%m-%d")
+    except (TypeError, ValueError):
+        return None
+
+def normalize_movie(data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Turn a TMDB movie payload into movies column values plus its genre ids
+
+    Accepts list results (genre_ids), details (genres) and daily export rows
+    (original_title only). Only fields present in the payload are returned, so
+    partial payloads never blank out columns. Returns None for unusable rows.
+    """
+    tmdb_id = data.get("id")
+    title = data.get("title") or data.get("original_title")
+    if not isinstance(tmdb_id, int) or not title:
+        return None
+
+    row = {"tmdb_id": tmdb_id, "title": title}
+    for field in MOVIE_FIELDS[1:]:
+        if field in data:
+            row[field] = _parse_date(data[field]) if field == "release_date" else data[field]
+
+    if "genre_ids" in data:
+        row["genre_ids"] = [genre_id for genre_id in data["genre_ids"] if isinstance(genre_id, int)]
+    elif "genres" in data:
+        row["genre_ids"] = [genre["id"] for genre in data["genres"] if isinstance(genre.get("id"), int)]
+    return row
+
+def _movie_columns(row: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: value for key, value in row.items() if key != "genre_ids"}
+
+def _group_by_columns(rows: Iterable[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    """Split rows by their set of keys, executemany needs the same columns in every row"""
+    groups = {}
+    for row in rows:
+        groups.setdefault(tuple(sorted(row)), []).append(row)
+    return list(groups.values())
+
+def _insert_new(db: Session, model, rows: List[Dict[str, Any]], index_elements: List[str]):
+    """executemany INSERT that skips rows whose key already exists
+
+    Rows were checked against the table beforehand, ON CONFLICT DO NOTHING only
+    covers a concurrent writer inserting the same key in between.
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        statement = sqlite.insert(model).on_conflict_do_nothing(index_elements=index_elements)
+    elif dialect == "postgresql":
+        statement = postgresql.insert(model).on_conflict_do_nothing(index_elements=index_elements)
+    else:
+        statement = insert(model)
+    db.execute(statement, rows)
+
+def upsert_genres(db: Session, genres: Iterable[Dict[str, Any]], commit: bool = True) -> int:
+    """Insert or rename genres from a TMDB genre list, returns how many were new"""
+    genres = {genre["id"]: genre["name"] for genre in genres if genre.get("id") and genre.get("name")}
+    if not genres:
+        return 0
+
+    existing = dict(db.query(Genre.id, Genre.name).filter(Genre.id.in_(genres)).all())
+    new_rows = [{"id": genre_id, "name": name} for genre_id, name in genres.items() if genre_id not in existing]
+    renamed = [
+        {"id": genre_id, "name": name}
+        for genre_id, name in genres.items()
+        if genre_id in existing and existing[genre_id] != name
+    ]
+
+    if new_rows:
+        _insert_new(db, Genre, new_rows, ["id"])
+    if renamed:
+        db.execute(update(Genre), renamed)
+    if commit:
+        db.commit()
+    return len(new_rows)
+
+def upsert_movies(
+    db: Session,
+    movies_data: Iterable[Dict[str, Any]],
+    commit: bool = True,
+    details: bool = False
+) -> UpsertResult:
+    """Insert or refresh a batch of TMDB movies and their genre links in one transaction
+
+    Existing rows and genres are prefetched with one IN query each, new and
+    changed rows are written with executemany, and genre ids that are not in
+    the genres table are skipped. Nothing is flushed row by row, so a page of
+    results costs a handful of statements and at most one commit. Pass
+    details=True for full details responses to mark the rows as fresh.
+    """
+    fetched_at = datetime.now()
+    rows = {}
+    for data in movies_data:
+        row = normalize_movie(data)
+        if row is not None:
+            if details:
+                row["details_fetched_at"] = fetched_at
+            rows[row["tmdb_id"]] = row
+    if not rows:
+        return UpsertResult([], [])
+
+    existing = dict(db.query(Movie.tmdb_id, Movie.id).filter(Movie.tmdb_id.in_(list(rows))).all())
+    genre_ids = {genre_id for row in rows.values() for genre_id in row.get("genre_ids", [])}
+    known_genres = {genre_id for (genre_id,) in db.query(Genre.id).filter(Genre.id.in_(genre_ids)).all()} if genre_ids else set()
+
+    new_rows = [_movie_columns(row) for tmdb_id, row in rows.items() if tmdb_id not in existing]
+    changed_rows = [{"id": existing[tmdb_id], **_movie_columns(row)} for tmdb_id, row in rows.items() if tmdb_id in existing]
+
+    for group in _group_by_columns(new_rows):
+        _insert_new(db, Movie, group, ["tmdb_id"])
+    for group in _group_by_columns(changed_rows):
+        db.execute(update(Movie), group)
+
+    movie_ids = existing
+    if new_rows:
+        movie_ids = {
+            **existing,
+            **dict(db.query(Movie.tmdb_id, Movie.id).filter(Movie.tmdb_id.in_([row["tmdb_id"] for row in new_rows])).all())
+        }
+
+    # Link genres, only adding the pairs that are missing
+    wanted = {
+        (movie_ids[tmdb_id], genre_id)
+        for tmdb_id, row in rows.items()
+        for genre_id in row.get("genre_ids", [])
+        if genre_id in known_genres
+    }
+    if wanted:
+        linked = set(
+            db.query(movie_genre.c.movie_id, movie_genre.c.genre_id)
+            .filter(movie_genre.c.movie_id.in_({movie_id for movie_id, _ in wanted}))
+            .all()
+        )
+        links = [{"movie_id": movie_id, "genre_id": genre_id} for movie_id, genre_id in wanted - linked]
+        if links:
+            db.execute(movie_genre.insert(), links)
+
+    if commit:
+        db.commit()
+
+    return UpsertResult(
+        inserted=[movie_ids[row["tmdb_id"]] for row in new_rows],
+        updated=[row["id"] for row in changed_rows]
+    )
+
+def get_movie(db: Session, tmdb_id: int) -> Optional[Movie]:
+    """A movie and its genres by tmdb id, in one indexed query"""
+    return db.query(Movie).options(joinedload(Movie.genres)).filter(Movie.tmdb_id == tmdb_id).first()
+
+def has_fresh_details(movie: Movie) -> bool:
+    """Whether the full details of a movie were read from TMDB recently enough to serve"""
+    if movie.details_fetched_at is None:
+        return False
+    return datetime.now() - movie.details_fetched_at < timedelta(hours=settings.movie_details_ttl_hours)
+
+def save_movie_details(db: Session, data: Dict[str, Any]) -> Tuple[Optional[Movie], bool]:
+    """Write a TMDB details response and its genres in one transaction
+
+    Returns the stored movie and whether it was new to the catalog.
+    """
+    upsert_genres(db, data.get("genres", []), commit=False)
+    result = upsert_movies(db, [data], commit=False, details=True)
+    db.commit()
+
+    # The session may already hold the movie, loaded with its genres before this write, reload both
+    movie = (
+        db.query(Movie)
+        .options(joinedload(Movie.genres))
+        .filter(Movie.tmdb_id == data.get("id"))
+        .execution_options(populate_existing=True)
+        .first()
+    )
+    return movie, bool(result.inserted)
+
+def get_movie_metadata(db: Session, tmdb_id: int):
+    """(title, poster_path) of a catalog movie, None if the catalog doesn't have it"""
+    return db.query(Movie.title, Movie.poster_path).filter(Movie.tmdb_id == tmdb_id).first()
+
+def fill_entry_metadata(db: Session, tmdb_id: int, title: str, poster_path: Optional[str], commit: bool = True) -> int:
+    """Copy a movie's title and poster into the user entries saved without them, returns how many"""
+    filled = 0
+    for model in (WatchHistory, Watchlist, Rating):
+        filled += db.query(model).filter(model.movie_id == tmdb_id, model.title.is_(None)).update(
+            {"title": title, "poster_path": poster_path},
+            synchronize_session=False
+        )
+    if commit:
+        db.commit()
+    return filled
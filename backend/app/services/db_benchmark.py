@@ -0,0 +1,116 @@
+import os
+import random
+import tempfile
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+from app.models.database import Base, create_database_engine
+from app.models.movie import WatchHistory
+import logging
+
+logger = logging.getLogger(__name__)
+
+def _percentile(latencies: List[float], q: float) -> float:
+    if not latencies:
+        return 0.0
+    latencies = sorted(latencies)
+    return latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000
+
+def run_workload(engine: Engine, seconds: float, readers: int, writers: int, users: int = 1000, page_size: int = 20) -> Dict:
+    """Hammer a database with the watch history workload from concurrent threads
+
+    Writers upsert one entry per transaction, as POST /users/watch-history
+    does, while readers fetch the first page of a user's history. Returns
+    operations per second, latency percentiles and locking errors of each.
+    """
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine, autoflush=False)
+
+    # Seed every user with a page of history so reads return rows
+    with Session() as db:
+        db.add_all([
+            WatchHistory(user_id=user_id, movie_id=movie_id, title=f"Movie {movie_id}", watched_at=datetime.now())
+            for user_id in range(1, users + 1)
+            for movie_id in range(page_size)
+        ])
+        db.commit()
+
+    stop = threading.Event()
+    latencies = {"read": [], "write": []}
+    errors = {"read": 0, "write": 0}
+    lock = threading.Lock()
+
+    def worker(kind: str, seed: int):
+        rng = random.Random(seed)
+        local_latencies = []
+        local_errors = 0
+        try:
+            while not stop.is_set():
+                user_id = rng.randint(1, users)
+                started = time.perf_counter()
+                try:
+                    with Session() as db:
+                        if kind == "write":
+                            statement = sqlite.insert(WatchHistory).values(
+                                user_id=user_id, movie_id=rng.randint(1, 100000), title="New", watched_at=datetime.now()
+                            )
+                            db.execute(statement.on_conflict_do_update(
+                                index_elements=[WatchHistory.user_id, WatchHistory.movie_id],
+                                set_={"watched_at": statement.excluded.watched_at}
+                            ))
+                            db.commit()
+                        else:
+                            db.query(WatchHistory).filter(WatchHistory.user_id == user_id).order_by(
+                                WatchHistory.watched_at.desc(), WatchHistory.id.desc()
+                            ).limit(page_size).all()
+                except OperationalError:
+                    # "database is locked" once the busy timeout runs out
+                    local_errors += 1
+                    continue
+                local_latencies.append(time.perf_counter() - started)
+        except Exception as e:
+            local_errors += 1
+            logger.error(f"Benchmark {kind} thread stopped: {str(e)}")
+        finally:
+            # Count what a failing thread did before it stopped too
+            with lock:
+                latencies[kind].extend(local_latencies)
+                errors[kind] += local_errors
+
+    threads = [threading.Thread(target=worker, args=("read", i)) for i in range(readers)]
+    threads += [threading.Thread(target=worker, args=("write", readers + i)) for i in range(writers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    return {
+        kind: {
+            "ops_per_second": len(latencies[kind]) / seconds,
+            "p50_ms": _percentile(latencies[kind], 0.5),
+            "p99_ms": _percentile(latencies[kind], 0.99),
+            "errors": errors[kind]
+        }
+        for kind in ("read", "write")
+    }
+
+def benchmark_sqlite_profiles(seconds: float = 10.0, readers: int = 8, writers: int = 2, directory: str = None) -> Dict[str, Dict]:
+    """Run the workload on a scratch SQLite file with SQLite's defaults, then with the configured pragmas"""
+    results = {}
+    with tempfile.TemporaryDirectory(dir=directory) as scratch:
+        for profile, pragmas in (("default", False), ("tuned", True)):
+            path = os.path.join(scratch, f"{profile}.db")
+            engine = create_database_engine(f"sqlite:///{path}", sqlite_pragmas=pragmas)
+            try:
+                results[profile] = run_workload(engine, seconds, readers, writers)
+            finally:
+                engine.dispose()
+            logger.info(f"{profile}: {results[profile]}")
+    return results
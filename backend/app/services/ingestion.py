@@ -0,0 +1,272 @@
+import asyncio
+import json
+import os
+import time
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple
+from app.models.database import SessionLocal
+from app.services.catalog_service import upsert_genres, upsert_movies
+from app.services.tmdb_service import tmdb_service
+import logging
+
+logger = logging.getLogger(__name__)
+
+# TMDB never serves list pages past this one
+MAX_TMDB_PAGE = 500
+
+# A unit of work: a checkpoint key and the raw TMDB movies it holds
+Page = Tuple[str, List[Dict[str, Any]]]
+
+class IngestCheckpoint:
+    """Keys of pages already written to the database, kept in a JSON file
+
+    Keys are only recorded after the batch holding them has been committed,
+    so an interrupted run picks up exactly the pages it had not finished.
+    """
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self.done = set()
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self.done = set(json.load(f).get("done", []))
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.done
+
+    def mark(self, keys: Iterable[str]):
+        self.done.update(keys)
+        if not self.path:
+            return
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path + ".tmp", "w") as f:
+            json.dump({"done": sorted(self.done)}, f)
+        os.replace(self.path + ".tmp", self.path)
+
+    def reset(self):
+        self.done = set()
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+def _movies_in(payload: Any) -> List[Dict[str, Any]]:
+    """Movies held by a TMDB JSON document: a list page, a details object or a plain list"""
+    if isinstance(payload, list):
+        return [item for item in payload if isinstance(item, dict)]
+    if isinstance(payload, dict):
+        if isinstance(payload.get("results"), list):
+            return _movies_in(payload["results"])
+        if "id" in payload:
+            return [payload]
+    return []
+
+def load_fixture_genres(fixture_dir: str) -> List[Dict[str, Any]]:
+    """Genre list from genres.json in a fixture directory, the shape of /genre/movie/list"""
+    path = os.path.join(fixture_dir, "genres.json")
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return json.load(f).get("genres", [])
+
+def fixture_pages(fixture_dir: str, checkpoint: IngestCheckpoint, page_size: int = 1000) -> Iterable[Page]:
+    """Read TMDB JSON dumps from a directory tree without touching the network
+
+    .json files hold a list page, a details object or a list of movies.
+    .jsonl/.ndjson files (e.g. TMDB daily exports) hold one movie per line and
+    are cut into pages of page_size lines so huge files stream in pieces.
+    """
+    for root, dirs, files in os.walk(fixture_dir):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            relative = os.path.relpath(path, fixture_dir)
+
+            if name.endswith(".json") and name != "genres.json":
+                if relative in checkpoint:
+                    continue
+                try:
+                    with open(path) as f:
+                        yield relative, _movies_in(json.load(f))
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Skipping unreadable fixture {relative}: {str(e)}")
+
+            elif name.endswith((".jsonl", ".ndjson")):
+                with open(path) as f:
+                    chunk, number = [], 0
+                    for line in f:
+                        chunk.append(line)
+                        if len(chunk) == page_size:
+                            yield from _jsonl_page(f"{relative}:{number}", chunk, checkpoint)
+                            chunk, number = [], number + 1
+                    if chunk:
+                        yield from _jsonl_page(f"{relative}:{number}", chunk, checkpoint)
+
+def _jsonl_page(key: str, lines: List[str], checkpoint: IngestCheckpoint) -> Iterable[Page]:
+    if key in checkpoint:
+        return
+    movies = []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            movies.extend(_movies_in(json.loads(line)))
+        except ValueError:
+            logger.warning(f"Skipping malformed line in {key}")
+    yield key, movies
+
+async def tmdb_pages(
+    checkpoint: IngestCheckpoint,
+    source: str = "popular",
+    years: Optional[Iterable[int]] = None,
+    max_pages: int = MAX_TMDB_PAGE,
+    concurrency: int = 8
+) -> AsyncIterator[Page]:
+    """Walk TMDB list pages concurrently, yielding them as they arrive
+
+    source is "popular", or "discover" to walk popularity-sorted pages per
+    release year, which reaches far more of the catalog than the 500-page cap
+    on a single listing. Pages that fail are logged and left for the next run.
+    """
+    if source == "discover":
+        listings = [
+            (f"discover:{year}", lambda page, year=year: tmdb_service.discover_movies({
+                "primary_release_year": year,
+                "sort_by": "popularity.desc",
+                "include_adult": False,
+                "page": page
+            }))
+            for year in (years or [])
+        ]
+    else:
+        listings = [("popular", tmdb_service.get_popular_movies)]
+
+    max_pages = min(max_pages, MAX_TMDB_PAGE)
+    semaphore = asyncio.Semaphore(concurrency)
+    queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+
+    async def fetch(prefix: str, fetch_page, page: int) -> Optional[Dict]:
+        async with semaphore:
+            try:
+                return await fetch_page(page)
+            except Exception as e:
+                logger.warning(f"Failed to fetch {prefix} page {page}: {str(e)}")
+                return None
+
+    async def walk(prefix: str, fetch_page):
+        # The first page says how many there are
+        first = await fetch(prefix, fetch_page, 1)
+        if first is None:
+            return
+        if f"{prefix}:1" not in checkpoint:
+            await queue.put((f"{prefix}:1", first.get("results", [])))
+
+        async def fetch_into_queue(page: int):
+            response = await fetch(prefix, fetch_page, page)
+            if response is not None:
+                await queue.put((f"{prefix}:{page}", response.get("results", [])))
+
+        total_pages = min(first.get("total_pages", 1), max_pages)
+        await asyncio.gather(*(
+            fetch_into_queue(page)
+            for page in range(2, total_pages + 1)
+            if f"{prefix}:{page}" not in checkpoint
+        ))
+
+    async def produce():
+        try:
+            await asyncio.gather(*(walk(prefix, fetch_page) for prefix, fetch_page in listings))
+        finally:
+            await queue.put(None)
+
+    producer = asyncio.create_task(produce())
+    try:
+        while True:
+            page = await queue.get()
+            if page is None:
+                break
+            yield page
+    finally:
+        producer.cancel()
+
+def _write_batch(pages: List[Page]) -> Tuple[int, int]:
+    """Upsert the movies of several pages in one transaction"""
+    db = SessionLocal()
+    try:
+        result = upsert_movies(db, [movie for _, movies in pages for movie in movies])
+        return len(result.inserted), len(result.updated)
+    finally:
+        db.close()
+
+async def ingest(pages, checkpoint: IngestCheckpoint, batch_size: int = 1000) -> Dict:
+    """Stream pages through normalise and bulk upsert, checkpointing each committed batch
+
+    pages is an iterable or async iterable of (key, movies). Database writes
+    run in a worker thread, so fetching carries on while a batch is written.
+    """
+    started = time.perf_counter()
+    stats = {"pages": 0, "movies": 0, "inserted": 0, "updated": 0}
+    batch: List[Page] = []
+    batch_movies = 0
+    pending = None
+
+    async def flush(batch: List[Page]):
+        inserted, updated = await asyncio.to_thread(_write_batch, batch)
+        checkpoint.mark(key for key, _ in batch)
+        stats["pages"] += len(batch)
+        stats["inserted"] += inserted
+        stats["updated"] += updated
+        logger.info(f"Ingested {stats['pages']} pages, {stats['inserted']} new and {stats['updated']} updated movies")
+
+    async def iterate():
+        if hasattr(pages, "__aiter__"):
+            async for page in pages:
+                yield page
+        else:
+            for page in pages:
+                yield page
+
+    async for key, movies in iterate():
+        batch.append((key, movies))
+        batch_movies += len(movies)
+        stats["movies"] += len(movies)
+        if batch_movies >= batch_size:
+            # Keep one write in flight while the next batch fills up
+            if pending is not None:
+                await pending
+            pending = asyncio.create_task(flush(batch))
+            batch, batch_movies = [], 0
+
+    if pending is not None:
+        await pending
+    if batch:
+        await flush(batch)
+
+    stats["seconds"] = time.perf_counter() - started
+    stats["movies_per_second"] = stats["movies"] / stats["seconds"] if stats["seconds"] > 0 else 0.0
+    return stats
+
+async def ingest_from_tmdb(checkpoint: IngestCheckpoint, batch_size: int = 1000, **options) -> Dict:
+    """Refresh genres, then ingest TMDB list pages, see tmdb_pages for the options"""
+    try:
+        genres = await tmdb_service.get_movie_genres()
+        db = SessionLocal()
+        try:
+            upsert_genres(db, genres.get("genres", []))
+        finally:
+            db.close()
+
+        return await ingest(tmdb_pages(checkpoint, **options), checkpoint, batch_size)
+    finally:
+        await tmdb_service.close()
+
+async def ingest_from_fixtures(fixture_dir: str, checkpoint: IngestCheckpoint, batch_size: int = 1000) -> Dict:
+    """Ingest a directory of TMDB JSON dumps, genres first from its genres.json"""
+    db = SessionLocal()
+    try:
+        upsert_genres(db, load_fixture_genres(fixture_dir))
+    finally:
+        db.close()
+
+    return await ingest(fixture_pages(fixture_dir, checkpoint), checkpoint, batch_size)
@@ -0,0 +1,168 @@
+import os
+import threading
+import numpy as np
+import scipy.sparse as sp
+from typing import List, Optional, Tuple
+from app.utils.ranking import top_k_indices
+import logging
+
+logger = logging.getLogger(__name__)
+
+def _als_step(interactions: sp.csr_matrix, fixed: np.ndarray, regularization: float, alpha: float) -> np.ndarray:
+    """Solve one side of implicit ALS (Hu, Koren & Volinsky) with the other side held fixed"""
+    n_factors = fixed.shape[1]
+    gram = fixed.T @ fixed
+    identity = regularization * np.eye(n_factors, dtype=np.float64)
+    solved = np.zeros((interactions.shape[0], n_factors), dtype=np.float64)
+
+    for row in range(interactions.shape[0]):
+        start, end = interactions.indptr[row], interactions.indptr[row + 1]
+        if start == end:
+            continue
+
+        # Only observed items change the confidence, so the solve costs
+        # O(nnz_row * f^2 + f^3) on top of the shared Gram matrix
+        idx = interactions.indices[start:end]
+        confidence = alpha * interactions.data[start:end]
+        factors = fixed[idx]
+
+        a = gram + (factors.T * confidence) @ factors + identity
+        b = factors.T @ (1.0 + confidence)
+        solved[row] = np.linalg.solve(a, b)
+
+    return solved
+
+def train_als(
+    user_items: sp.csr_matrix,
+    factors: int = 32,
+    regularization: float = 0.1,
+    alpha: float = 40.0,
+    iterations: int = 15,
+    seed: int = 0
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Factorise an implicit-feedback user x item matrix into user and item factors"""
+    rng = np.random.default_rng(seed)
+    user_items = user_items.tocsr().astype(np.float64)
+    item_users = user_items.T.tocsr()
+
+    user_factors = rng.normal(scale=0.01, size=(user_items.shape[0], factors))
+    item_factors = rng.normal(scale=0.01, size=(user_items.shape[1], factors))
+
+    for iteration in range(iterations):
+        user_factors = _als_step(user_items, item_factors, regularization, alpha)
+        item_factors = _als_step(item_users, user_factors, regularization, alpha)
+        logger.info(f"ALS iteration {iteration + 1}/{iterations} done")
+
+    return user_factors.astype(np.float32), item_factors.astype(np.float32)
+
+class MatrixFactorizationModel:
+    """User and item factors persisted as .npy files, served with one dot product per user"""
+
+    USER_FACTORS_FILE = "user_factors.npy"
+    ITEM_FACTORS_FILE = "item_factors.npy"
+    USER_IDS_FILE = "user_ids.npy"
+    ITEM_IDS_FILE = "item_ids.npy"
+    USER_ITEMS_FILE = "user_items.npz"
+    # Written last, so its mtime marks a complete model on disk
+    VERSION_FILE = "VERSION"
+
+    def __init__(self, model_dir: str):
+        self.model_dir = model_dir
+        self.user_factors = None
+        self.item_factors = None
+        self.user_ids = None  # user row -> User.id
+        self.item_ids = None  # item row -> tmdb id
+        self.user_items = None  # training interactions, used to skip seen items
+        self.version = None
+        self._user_rows = {}  # User.id -> user row
+        self._loaded_mtime = None
+        self._lock = threading.Lock()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.model_dir, name)
+
+    def save(self, user_factors, item_factors, user_ids, item_ids, user_items: sp.csr_matrix):
+        """Write a trained model to disk, replacing any previous version atomically"""
+        os.makedirs(self.model_dir, exist_ok=True)
+
+        arrays = {
+            self.USER_FACTORS_FILE: user_factors,
+            self.ITEM_FACTORS_FILE: item_factors,
+            self.USER_IDS_FILE: np.asarray(user_ids, dtype=np.int64),
+            self.ITEM_IDS_FILE: np.asarray(item_ids, dtype=np.int64),
+        }
+        for name, array in arrays.items():
+            with open(self._path(name) + ".tmp", "wb") as f:
+                np.save(f, array)
+        sp.save_npz(self._path(self.USER_ITEMS_FILE) + ".tmp.npz", user_items.tocsr())
+
+        for name in arrays:
+            os.replace(self._path(name) + ".tmp", self._path(name))
+        os.replace(self._path(self.USER_ITEMS_FILE) + ".tmp.npz", self._path(self.USER_ITEMS_FILE))
+
+        with open(self._path(self.VERSION_FILE) + ".tmp", "w") as f:
+            f.write(f"{user_factors.shape[0]} users, {item_factors.shape[0]} items, {user_factors.shape[1]} factors\n")
+        os.replace(self._path(self.VERSION_FILE) + ".tmp", self._path(self.VERSION_FILE))
+
+    def _version_mtime(self) -> Optional[float]:
+        try:
+            return os.path.getmtime(self._path(self.VERSION_FILE))
+        except OSError:
+            return None
+
+    def load(self) -> bool:
+        """Load the model from disk, returns False if there is none"""
+        mtime = self._version_mtime()
+        if mtime is None:
+            return False
+
+        try:
+            user_factors = np.load(self._path(self.USER_FACTORS_FILE))
+            item_factors = np.load(self._path(self.ITEM_FACTORS_FILE))
+            user_ids = np.load(self._path(self.USER_IDS_FILE))
+            item_ids = np.load(self._path(self.ITEM_IDS_FILE))
+            user_items = sp.load_npz(self._path(self.USER_ITEMS_FILE)).tocsr()
+        except Exception as e:
+            logger.error(f"Failed to load matrix factorisation model: {str(e)}")
+            return False
+
+        # Swap everything in at once so concurrent readers see one consistent model
+        with self._lock:
+            self.user_factors = user_factors
+            self.item_factors = item_factors
+            self.user_ids = user_ids
+            self.item_ids = item_ids
+            self.user_items = user_items
+            self._user_rows = {int(user_id): row for row, user_id in enumerate(user_ids)}
+            self._loaded_mtime = mtime
+            self.version = f"mf-{int(mtime)}"
+
+        logger.info(f"Loaded matrix factorisation model {self.version} ({len(user_ids)} users, {len(item_ids)} items)")
+        return True
+
+    def reload_if_changed(self) -> bool:
+        """Hot-reload the model when a newer one has been written, costs one stat() otherwise"""
+        mtime = self._version_mtime()
+        if mtime is None or mtime == self._loaded_mtime:
+            return False
+        return self.load()
+
+    def recommend(self, user_id: int, limit: int = 10, exclude_item_ids=None) -> List[int]:
+        """Top-N tmdb ids for a user, empty if the user isn't in the model"""
+        with self._lock:
+            if self.user_factors is None or user_id not in self._user_rows:
+                return []
+            row = self._user_rows[user_id]
+            user_factors, item_factors = self.user_factors, self.item_factors
+            item_ids, seen = self.item_ids, self.user_items[row].indices
+
+        scores = item_factors @ user_factors[row]
+
+        # Never recommend what the user already interacted with
+        scores[seen] = -np.inf
+        if exclude_item_ids:
+            scores[np.isin(item_ids, list(exclude_item_ids))] = -np.inf
+
+        top = top_k_indices(scores, limit)
+        top = top[np.isfinite(scores[top])]
+        return [int(i) for i in item_ids[top]]
@@ -0,0 +1,95 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import func, insert
+from app.models.database import SessionLocal
+from app.models.movie import Movie, UserRecommendation
+from app.models.user import User
+from app.services.recommendation_service import init_scoring_worker, recommendation_service, score_user_chunk
+import logging
+
+logger = logging.getLogger(__name__)
+
+def _write_chunk(results: List[Tuple[int, List[int]]], model_version: str) -> int:
+    """Replace the materialised lists of a chunk of users in one transaction"""
+    generated_at = datetime.now()
+    rows = [
+        {
+            "user_id": user_id,
+            "rank": rank,
+            "movie_id": movie_id,
+            "model_version": model_version,
+            "generated_at": generated_at
+        }
+        for user_id, movie_ids in results
+        for rank, movie_id in enumerate(movie_ids)
+    ]
+
+    db = SessionLocal()
+    try:
+        db.query(UserRecommendation).filter(
+            UserRecommendation.user_id.in_([user_id for user_id, _ in results])
+        ).delete(synchronize_session=False)
+        if rows:
+            db.execute(insert(UserRecommendation), rows)
+        db.commit()
+    finally:
+        db.close()
+
+    return len(rows)
+
+def materialize_recommendations(limit: int = 50, chunk_size: int = 200, workers: Optional[int] = None) -> Dict:
+    """Score every user and write their top-N lists to user_recommendations
+
+    Users are split into chunks that are scored in vectorised batches across
+    a process pool. Returns counts and throughput for reporting.
+    """
+    workers = workers or os.cpu_count() or 1
+    started = time.perf_counter()
+
+    db = SessionLocal()
+    try:
+        # Make sure workers load an index that covers the whole catalog,
+        # rather than each of them fitting or catching up on its own
+        content_index = recommendation_service.content_index
+        if content_index is None:
+            recommendation_service.load_content_index()
+            content_index = recommendation_service.content_index
+        if content_index is None or content_index.vectors.shape[0] != db.query(func.count(Movie.id)).scalar():
+            recommendation_service.build_content_index(db)
+
+        recommendation_service.mf_model.reload_if_changed()
+        model_version = recommendation_service.model_version
+        user_ids = [user_id for (user_id,) in db.query(User.id).order_by(User.id).all()]
+    finally:
+        db.close()
+
+    chunks = [user_ids[i:i + chunk_size] for i in range(0, len(user_ids), chunk_size)]
+    users_done = 0
+    rows_written = 0
+
+    if workers == 1:
+        for chunk in chunks:
+            rows_written += _write_chunk(score_user_chunk(chunk, limit), model_version)
+            users_done += len(chunk)
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_scoring_worker) as executor:
+            futures = [executor.submit(score_user_chunk, chunk, limit) for chunk in chunks]
+            # Results are written by this process as they arrive, so workers never contend for writes
+            for future in as_completed(futures):
+                results = future.result()
+                rows_written += _write_chunk(results, model_version)
+                users_done += len(results)
+                logger.info(f"Materialised {users_done}/{len(user_ids)} users")
+
+    elapsed = time.perf_counter() - started
+    return {
+        "users": users_done,
+        "rows": rows_written,
+        "workers": workers,
+        "model_version": model_version,
+        "seconds": elapsed,
+        "users_per_second": users_done / elapsed if elapsed > 0 else 0.0
+    }
@@ -1,23 +1,154 @@
+import os
+import threading
+import joblib
 import pandas as pd
 import numpy as np
+import scipy.sparse as sp
+from datetime import datetime
+from sklearn.decomposition import TruncatedSVD
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-from typing import List, Dict, Any
-from sqlalchemy.orm import Session
-from app.models.user import User
-from app.models.movie import Movie
+from typing import List, Dict, Any, Optional, NamedTuple, Tuple
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session, selectinload
+from app.models.user import User, user_genre
+from app.models.database import SessionLocal, engine
+from app.models.movie import Movie, WatchHistory, Rating, UserRecommendation
+from app.config import settings
+from app.services.ann_index import IVFIndex
+from app.services.matrix_factorization import MatrixFactorizationModel
+from app.utils.cache import LRUCache, SQLiteCache, TieredCache
+from app.utils.executors import BoundedProcessPool
+from app.utils.ranking import top_k_indices
+import logging
+
+logger = logging.getLogger(__name__)
+
+class Interactions(NamedTuple):
+    """Sparse user x item and user x genre matrices with their id mappings"""
+    user_items: sp.csr_matrix  # user row x item column, implicit feedback strength
+    user_genres: sp.csr_matrix  # user row x genre column, 1 for a preferred genre
+    user_ids: np.ndarray  # user row -> User.id
+    item_ids: np.ndarray  # item column -> tmdb id
+    user_index: pd.Series  # User.id -> user row
+
+def load_interactions(db: Session) -> Interactions:
+    """Build the user x item and user x genre matrices from the interaction tables"""
+    # Watching a movie counts as 1, a rating as rating / 5 (so 10 stars counts as 2)
+    watched = pd.DataFrame(
+        db.query(WatchHistory.user_id, WatchHistory.movie_id).all(),
+        columns=['user_id', 'movie_id']
+    ).assign(weight=1.0)
+    rated = pd.DataFrame(
+        db.query(Rating.user_id, Rating.movie_id, Rating.rating).all(),
+        columns=['user_id', 'movie_id', 'rating']
+    )
+    rated = rated.assign(weight=rated['rating'].astype(float) / 5.0).drop(columns='rating')
+    events = pd.concat([watched, rated], ignore_index=True).dropna()
+    events = events.groupby(['user_id', 'movie_id'], as_index=False)['weight'].max()
+    
+    preferences = pd.DataFrame(
+        db.execute(select(user_genre.c.user_id, user_genre.c.genre_id)).all(),
+        columns=['user_id', 'genre_id']
+    ).dropna().drop_duplicates()
+    
+    # Map ids to dense row/column numbers
+    user_ids = np.union1d(events['user_id'].to_numpy(dtype=np.int64), preferences['user_id'].to_numpy(dtype=np.int64))
+    item_ids = np.unique(events['movie_id'].to_numpy(dtype=np.int64))
+    genre_ids = np.unique(preferences['genre_id'].to_numpy(dtype=np.int64))
+    
+    user_items = sp.csr_matrix(
+        (
+            events['weight'].to_numpy(dtype=np.float32),
+            (np.searchsorted(user_ids, events['user_id']), np.searchsorted(item_ids, events['movie_id']))
+        ),
+        shape=(len(user_ids), len(item_ids))
+    )
+    user_genres = sp.csr_matrix(
+        (
+            np.ones(len(preferences), dtype=np.float32),
+            (np.searchsorted(user_ids, preferences['user_id']), np.searchsorted(genre_ids, preferences['genre_id']))
+        ),
+        shape=(len(user_ids), len(genre_ids))
+    )
+    
+    return Interactions(
+        user_items=user_items,
+        user_genres=user_genres,
+        user_ids=user_ids,
+        item_ids=item_ids,
+        user_index=pd.Series(np.arange(len(user_ids)), index=user_ids)
+    )
+
+class ContentIndex(NamedTuple):
+    """One immutable version of the content index, always replaced as a whole"""
+    vectorizer: TfidfVectorizer  # vocabulary and IDF frozen at the last full fit
+    vectors: sp.csr_matrix  # row -> L2-normalised TF-IDF vector
+    indices: pd.Series  # tmdb_id -> row in vectors
+    movie_ids: np.ndarray  # row in vectors -> Movie.id
+    svd: Optional[TruncatedSVD]  # TF-IDF -> dense embedding
+    ann_index: Optional[IVFIndex]  # nearest-neighbour index over the embeddings
+    fitted_rows: int  # rows covered by the last full fit, the rest were appended
 
 class RecommendationService:
     """Service for generating movie recommendations using different algorithms"""
     
-    def __init__(self):
-        # Cache for movie vectors (content-based filtering)
-        self.movie_vectors = None
-        self.movie_indices = None
+    VECTORS_FILE = "content_vectors.npz"
+    IDS_FILE = "content_ids.npy"
+    VECTORIZER_FILE = "content_vectorizer.joblib"
+    SVD_FILE = "content_svd.joblib"
+    ANN_DIR = "ann"
+    EMBEDDING_DIM = 128
+    # Personalized results are cached at least this deep so any page size can be served
+    CACHE_DEPTH = 50
+    
+    def __init__(self, index_dir: Optional[str] = None, read_only: bool = False):
+        # Directory holding the persisted content index
+        self.index_dir = index_dir or settings.recommendation_index_dir
+        
+        # Scoring workers only read the index the server saved, several of them
+        # writing the same files at once would corrupt it
+        self.read_only = read_only
+        
+        # Cache for movie vectors (content-based filtering). Readers take one
+        # reference to it per call, writers build a new one and swap it in
+        self.content_index: Optional[ContentIndex] = None
         self.last_update = None
+        
+        # Appends and background rebuilds are serialised, readers never take these
+        self._append_lock = threading.Lock()
+        self._rebuild_lock = threading.Lock()
+        
+        # Offline-trained matrix factorisation model, hot-reloaded from disk
+        self.mf_model = MatrixFactorizationModel(settings.mf_model_dir)
+        
+        # Worker processes for online scoring, so it never holds the server's GIL
+        self.scoring_pool = BoundedProcessPool(
+            settings.scoring_processes,
+            settings.scoring_queue_size,
+            initializer=init_scoring_worker
+        ) if settings.scoring_processes > 0 else None
+        
+        # Per-user personalized results, keyed by user id and model version
+        self.results_cache = TieredCache(
+            LRUCache(maxsize=settings.recommendation_cache_size, ttl=settings.recommendation_cache_ttl_seconds),
+            SQLiteCache(settings.recommendation_cache_path, ttl=settings.recommendation_cache_ttl_seconds)
+            if settings.recommendation_cache_path else None
+        )
     
-    def _prepare_content_features(self, movies):
-        """Prepare movie content features for content-based filtering"""
+    @property
+    def movie_vectors(self):
+        return self.content_index.vectors if self.content_index else None
+    
+    @property
+    def movie_indices(self):
+        return self.content_index.indices if self.content_index else None
+    
+    @property
+    def movie_ids(self):
+        return self.content_index.movie_ids if self.content_index else None
+    
+    def _movie_content(self, movies) -> pd.DataFrame:
+        """Combine the text features of movies into one document per movie"""
         # Create a DataFrame with movie features
         movie_data = []
         for movie in movies:
@@ -30,115 +161,423 @@ class RecommendationService:
                 'content': content
             })
         
-        df = pd.DataFrame(movie_data)
-        
-        # Create TF-IDF vectors from movie content
-        tfidf = TfidfVectorizer(stop_words='english')
-        tfidf_matrix = tfidf.fit_transform(df['content'])
+        return pd.DataFrame(movie_data, columns=['id', 'tmdb_id', 'content'])
+    
+    def _prepare_content_features(self, movies) -> ContentIndex:
+        """Prepare movie content features for content-based filtering"""
+        df = self._movie_content(movies)
         
-        # Calculate cosine similarity matrix
-        cosine_sim = cosine_similarity(tfidf_matrix, tfidf_matrix)
+        # Create L2-normalised TF-IDF vectors from movie content
+        tfidf = TfidfVectorizer(stop_words='english', norm='l2')
+        tfidf_matrix = tfidf.fit_transform(df['content']).tocsr()
         
         # Create a mapping of movie IDs to matrix indices
         indices = pd.Series(df.index, index=df['tmdb_id']).drop_duplicates()
         
-        return cosine_sim, indices
-    
-    def _content_based_recommendations(self, movie_tmdb_id, cosine_sim, indices, all_movies, limit=10):
-        """Get content-based recommendations for a movie"""
-        # Get the index of the movie
-        idx = indices[movie_tmdb_id]
-        
-        # Get similarity scores for all movies
-        sim_scores = list(enumerate(cosine_sim[idx]))
-        
-        # Sort movies based on similarity scores
-        sim_scores = sorted(sim_scores, key=lambda x: x[1], reverse=True)
-        
-        # Get top similar movies (excluding the movie itself)
-        sim_scores = sim_scores[1:limit+1]
-        
-        # Get movie indices
-        movie_indices = [i[0] for i in sim_scores]
-        
-        # Return the top movies
-        return [all_movies[i] for i in movie_indices]
-    
-    def _collaborative_filtering(self, user, all_movies, db, limit=10):
-        """Simple collaborative filtering based on user ratings"""
-        # Get all users and their ratings
-        users_ratings = db.query(User, Movie).join(
-            "watch_history"
-        ).filter(
-            Movie.id.in_([m.id for m in all_movies])
-        ).all()
-        
-        # Create a user-item matrix (simplified)
-        # In a real system, you would use a more sophisticated approach
-        # such as matrix factorization (SVD) from libraries like Surprise
-        
-        # For now, return movies liked by users with similar preferences
-        user_genres = set([g.id for g in user.preferences])
-        
-        # Find users with similar genre preferences
-        similar_users = []
-        for u, _ in users_ratings:
-            if u.id != user.id:
-                u_genres = set([g.id for g in u.preferences])
-                # Calculate Jaccard similarity between genre sets
-                similarity = len(user_genres.intersection(u_genres)) / len(user_genres.union(u_genres)) if user_genres or u_genres else 0
-                similar_users.append((u, similarity))
-        
-        # Sort users by similarity
-        similar_users.sort(key=lambda x: x[1], reverse=True)
-        similar_users = similar_users[:5]  # Consider top 5 similar users
-        
-        # Get movies liked by similar users but not watched by the current user
-        watched_movies = set([m.id for m in user.watch_history])
-        recommended_movies = []
-        
-        for similar_user, _ in similar_users:
-            for movie in similar_user.watch_history:
-                # Check if user rated this movie highly
-                # This requires additional logic to get the rating from the user_movie table
-                if movie.id not in watched_movies:
-                    recommended_movies.append(movie)
-                    if len(recommended_movies) >= limit:
-                        break
+        svd, ann_index = self._build_ann_index(tfidf_matrix, df['tmdb_id'].to_numpy())
         
-        return recommended_movies[:limit]
+        return ContentIndex(
+            vectorizer=tfidf,
+            vectors=tfidf_matrix,
+            indices=indices,
+            movie_ids=df['id'].to_numpy(),
+            svd=svd,
+            ann_index=ann_index,
+            fitted_rows=len(df)
+        )
     
-    def get_recommendations_for_user(self, user: User, limit: int, db: Session):
-        """Get personalized recommendations for a user using a hybrid approach"""
-        # Get all movies
+    def build_content_index(self, db: Session) -> bool:
+        """Fit the content index over the whole catalog, persist it and swap it in"""
         all_movies = db.query(Movie).all()
         
         if not all_movies:
+            return False
+        
+        content_index = self._prepare_content_features(all_movies)
+        if not self.read_only:
+            self.save_content_index(content_index)
+        
+        # Movies appended while we were fitting are not in the new index yet,
+        # add_movies will pick them up again on the next catch-up
+        self.content_index = content_index
+        # Dated like a loaded index, so processes sharing the saved files agree on model_version
+        vectors_path = os.path.join(self.index_dir, self.VECTORS_FILE)
+        self.last_update = datetime.now() if self.read_only else datetime.fromtimestamp(os.path.getmtime(vectors_path))
+        
+        logger.info(f"Built content index for {content_index.fitted_rows} movies")
+        return True
+    
+    def _build_ann_index(self, tfidf_matrix, tmdb_ids):
+        """Reduce TF-IDF vectors to dense embeddings and index them for fast similarity lookups"""
+        n_components = min(self.EMBEDDING_DIM, tfidf_matrix.shape[0] - 1, tfidf_matrix.shape[1] - 1)
+        if n_components < 2:
+            return None, None
+        
+        svd = TruncatedSVD(n_components=n_components, random_state=0)
+        embeddings = svd.fit_transform(tfidf_matrix)
+        return svd, IVFIndex.build(embeddings, tmdb_ids)
+    
+    def save_content_index(self, content_index: ContentIndex):
+        """Write the content index to disk, replacing any previous version atomically"""
+        os.makedirs(self.index_dir, exist_ok=True)
+        
+        ids = np.column_stack([content_index.movie_ids, content_index.indices.index.to_numpy()])
+        
+        vectors_path = os.path.join(self.index_dir, self.VECTORS_FILE)
+        ids_path = os.path.join(self.index_dir, self.IDS_FILE)
+        vectorizer_path = os.path.join(self.index_dir, self.VECTORIZER_FILE)
+        
+        # Write to temporary files first so readers never see a half-written index
+        sp.save_npz(vectors_path + ".tmp.npz", content_index.vectors)
+        with open(ids_path + ".tmp", "wb") as f:
+            np.save(f, ids)
+        joblib.dump(content_index.vectorizer, vectorizer_path + ".tmp")
+        
+        if content_index.ann_index is not None:
+            content_index.ann_index.save(os.path.join(self.index_dir, self.ANN_DIR))
+            joblib.dump(content_index.svd, os.path.join(self.index_dir, self.SVD_FILE))
+        
+        os.replace(vectors_path + ".tmp.npz", vectors_path)
+        os.replace(ids_path + ".tmp", ids_path)
+        os.replace(vectorizer_path + ".tmp", vectorizer_path)
+    
+    def load_content_index(self) -> bool:
+        """Load a previously persisted content index, returns False if there is none"""
+        vectors_path = os.path.join(self.index_dir, self.VECTORS_FILE)
+        ids_path = os.path.join(self.index_dir, self.IDS_FILE)
+        vectorizer_path = os.path.join(self.index_dir, self.VECTORIZER_FILE)
+        svd_path = os.path.join(self.index_dir, self.SVD_FILE)
+        
+        if not all(os.path.exists(p) for p in (vectors_path, ids_path, vectorizer_path)):
+            return False
+        
+        try:
+            movie_vectors = sp.load_npz(vectors_path).tocsr()
+            ids = np.load(ids_path)
+            vectorizer = joblib.load(vectorizer_path)
+            
+            # The ANN index is memory-mapped, so loading it costs almost nothing
+            ann_index = IVFIndex.load(os.path.join(self.index_dir, self.ANN_DIR))
+            svd = joblib.load(svd_path) if os.path.exists(svd_path) else None
+        except Exception as e:
+            logger.error(f"Failed to load content index: {str(e)}")
+            return False
+        
+        self.content_index = ContentIndex(
+            vectorizer=vectorizer,
+            vectors=movie_vectors,
+            indices=pd.Series(np.arange(len(ids)), index=ids[:, 1]),
+            movie_ids=ids[:, 0],
+            svd=svd if ann_index is not None else None,
+            ann_index=ann_index if svd is not None else None,
+            fitted_rows=len(ids)
+        )
+        self.last_update = datetime.fromtimestamp(os.path.getmtime(vectors_path))
+        
+        logger.info(f"Loaded content index for {len(ids)} movies")
+        return True
+    
+    @property
+    def model_version(self) -> str:
+        """Identifies the models results were scored with, appends to the content index don't count"""
+        content_version = int(self.last_update.timestamp()) if self.last_update else 0
+        return f"content-{content_version}:{self.mf_model.version or 'no-mf'}"
+    
+    def load_models(self):
+        """Load every persisted model, used at startup"""
+        self.load_content_index()
+        self.mf_model.load()
+    
+    def add_movies(self, movies) -> int:
+        """Append new movies to the content index without refitting it
+        
+        New rows are vectorised with the frozen vocabulary and IDF of the last
+        full fit and added to the nearest-neighbour delta segment. Once enough
+        rows have been appended, or the fit is old enough, a full rebuild is
+        started in the background. Returns the number of movies added.
+        """
+        with self._append_lock:
+            content_index = self.content_index
+            if content_index is None:
+                return 0
+            
+            movies = [movie for movie in movies if movie.tmdb_id not in content_index.indices]
+            if not movies:
+                return 0
+            
+            df = self._movie_content(movies).drop_duplicates('tmdb_id')
+            new_vectors = content_index.vectorizer.transform(df['content']).tocsr()
+            first_row = content_index.vectors.shape[0]
+            
+            ann_index = content_index.ann_index
+            if ann_index is not None:
+                ann_index = ann_index.add(content_index.svd.transform(new_vectors), df['tmdb_id'].to_numpy())
+            
+            # Build the next version off to the side, then swap it in with one assignment
+            self.content_index = content_index._replace(
+                vectors=sp.vstack([content_index.vectors, new_vectors], format='csr'),
+                indices=pd.concat([
+                    content_index.indices,
+                    pd.Series(np.arange(first_row, first_row + len(df)), index=df['tmdb_id'].to_numpy())
+                ]),
+                movie_ids=np.concatenate([content_index.movie_ids, df['id'].to_numpy()]),
+                ann_index=ann_index
+            )
+        
+        self._maybe_rebuild_in_background()
+        return len(df)
+    
+    def _maybe_rebuild_in_background(self):
+        """Start a full rebuild when too much has been appended or the fit is too old"""
+        content_index = self.content_index
+        appended = content_index.vectors.shape[0] - content_index.fitted_rows
+        too_many = appended > settings.content_index_rebuild_ratio * max(content_index.fitted_rows, 1)
+        too_old = (
+            self.last_update is not None and
+            (datetime.now() - self.last_update).total_seconds() > settings.content_index_rebuild_interval_hours * 3600
+        )
+        
+        if (too_many or too_old) and appended > 0 and not self.read_only:
+            self.rebuild_in_background()
+    
+    def rebuild_in_background(self) -> bool:
+        """Refit the content index on a background thread, returns False if one is already running"""
+        if not self._rebuild_lock.acquire(blocking=False):
+            return False
+        
+        def rebuild():
+            db = SessionLocal()
+            try:
+                self.build_content_index(db)
+            except Exception as e:
+                logger.error(f"Background content index rebuild failed: {str(e)}")
+            finally:
+                db.close()
+                self._rebuild_lock.release()
+        
+        threading.Thread(target=rebuild, name="content-index-rebuild", daemon=True).start()
+        return True
+    
+    def _ensure_content_index(self, db: Session) -> bool:
+        """Make sure the content index exists and covers the current catalog"""
+        if self.content_index is None or (self.read_only and self._saved_index_is_newer()):
+            self.load_content_index()
+        if self.content_index is None:
+            return self.build_content_index(db)
+        
+        # Catch up on movies saved since the index was built by appending them,
+        # new movies always get higher primary keys than anything indexed
+        content_index = self.content_index
+        if db.query(func.count(Movie.id)).scalar() != content_index.vectors.shape[0]:
+            max_indexed_id = int(content_index.movie_ids.max()) if len(content_index.movie_ids) else 0
+            self.add_movies(db.query(Movie).filter(Movie.id > max_indexed_id).all())
+        
+        return True
+    
+    def _saved_index_is_newer(self) -> bool:
+        """Whether the index on disk was saved after the one in memory was fitted"""
+        vectors_path = os.path.join(self.index_dir, self.VECTORS_FILE)
+        return (
+            self.last_update is not None and
+            os.path.exists(vectors_path) and
+            datetime.fromtimestamp(os.path.getmtime(vectors_path)) > self.last_update
+        )
+    
+    def similar_movies(self, movie_tmdb_id: int, limit: int = 10) -> Optional[List[int]]:
+        """Tmdb ids of the movies most similar to a movie, or None if the index doesn't know it"""
+        content_index = self.content_index
+        if content_index is None or content_index.ann_index is None:
+            return None
+        return content_index.ann_index.similar(movie_tmdb_id, limit)
+    
+    def _load_movies(self, db: Session, movie_ids) -> List[Movie]:
+        """Load movies by primary key, keeping the order of movie_ids"""
+        movie_ids = [int(i) for i in movie_ids]
+        if not movie_ids:
+            return []
+        
+        movies = db.query(Movie).filter(Movie.id.in_(movie_ids)).all()
+        by_id = {movie.id: movie for movie in movies}
+        return [by_id[i] for i in movie_ids if i in by_id]
+    
+    def _content_based_recommendations_batch(self, seed_tmdb_ids, limit=10, exclude_movie_ids=None):
+        """Get content-based recommendations for many users at once, as Movie ids per user
+        
+        seed_tmdb_ids and exclude_movie_ids hold one collection per user. Each
+        user's seeds are summed into a profile vector, and all profiles are
+        scored against the catalog with a single sparse matrix product.
+        """
+        content_index = self.content_index
+        vectors = content_index.vectors
+        n_users = len(seed_tmdb_ids)
+        exclude_movie_ids = exclude_movie_ids or [None] * n_users
+        
+        # Map each user's seeds to index rows, dropping movies the index doesn't know
+        seed_rows = [
+            content_index.indices.reindex(list(seeds)).dropna().to_numpy(dtype=np.int64)
+            for seeds in seed_tmdb_ids
+        ]
+        seeds = sp.csr_matrix(
+            (
+                np.ones(sum(len(rows) for rows in seed_rows), dtype=np.float32),
+                np.concatenate(seed_rows) if n_users else np.empty(0, dtype=np.int64),
+                np.concatenate([[0], np.cumsum([len(rows) for rows in seed_rows])])
+            ),
+            shape=(n_users, vectors.shape[0])
+        )
+        
+        # One product scores every user: (users x movies) @ (movies x terms) @ (terms x movies)
+        profiles = seeds @ vectors
+        scores = (profiles @ vectors.T).toarray()
+        
+        results = []
+        for user_row in range(n_users):
+            if not len(seed_rows[user_row]):
+                results.append([])
+                continue
+            
+            # Mask out the seeds and anything already watched or recommended
+            user_scores = scores[user_row]
+            user_scores[seed_rows[user_row]] = -np.inf
+            if exclude_movie_ids[user_row]:
+                user_scores[np.isin(content_index.movie_ids, list(exclude_movie_ids[user_row]))] = -np.inf
+            
+            top = top_k_indices(user_scores, limit)
+            top = top[np.isfinite(user_scores[top])]
+            results.append([content_index.movie_ids[i] for i in top])
+        
+        return results
+    
+    def _collaborative_filtering(self, user, db, limit=10, neighbours=5, interactions: Optional[Interactions] = None):
+        """Collaborative filtering over the sparse user x item and user x genre matrices, as tmdb ids"""
+        # Batch callers load the matrices once and pass them in
+        if interactions is None:
+            interactions = load_interactions(db)
+        
+        if user.id not in interactions.user_index or not interactions.item_ids.size:
+            return []
+        
+        row = interactions.user_index[user.id]
+        user_items = interactions.user_items
+        user_genres = interactions.user_genres
+        
+        # Cosine similarity between this user's items and everybody else's
+        item_norms = np.sqrt(np.asarray(user_items.multiply(user_items).sum(axis=1)).ravel())
+        item_dot = (user_items @ user_items[row].T).toarray().ravel()
+        denominator = item_norms * item_norms[row]
+        cosine = np.divide(item_dot, denominator, out=np.zeros_like(item_dot), where=denominator > 0)
+        
+        # Jaccard similarity between genre preference sets
+        genre_sizes = np.asarray(user_genres.sum(axis=1)).ravel()
+        intersection = (user_genres @ user_genres[row].T).toarray().ravel()
+        union = genre_sizes + genre_sizes[row] - intersection
+        jaccard = np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+        
+        similarity = cosine + jaccard
+        similarity[row] = -np.inf
+        
+        # Consider the most similar users only
+        similar_rows = top_k_indices(similarity, neighbours)
+        similar_rows = similar_rows[similarity[similar_rows] > 0]
+        if not len(similar_rows):
+            return []
+        
+        # Score items by the neighbours' feedback weighted by their similarity,
+        # skipping anything this user has already interacted with
+        scores = np.asarray(user_items[similar_rows].T @ similarity[similar_rows]).ravel()
+        scores[user_items[row].indices] = 0
+        
+        top = top_k_indices(scores, limit)
+        top = top[scores[top] > 0]
+        return [int(i) for i in interactions.item_ids[top]]
+    
+    def load_movies_by_tmdb_id(self, db: Session, tmdb_ids) -> List[Movie]:
+        """Load movies by tmdb id, keeping the order of tmdb_ids"""
+        if not tmdb_ids:
             return []
         
-        # Get user's watched movies
-        watched_movies = user.watch_history
+        # Callers serialise genre ids, load them in one query rather than one per movie
+        movies = db.query(Movie).options(selectinload(Movie.genres)).filter(Movie.tmdb_id.in_(tmdb_ids)).all()
+        by_tmdb_id = {movie.tmdb_id: movie for movie in movies}
+        return [by_tmdb_id[i] for i in tmdb_ids if i in by_tmdb_id]
+    
+    def get_recommendations_for_user(self, user: User, limit: int, db: Session):
+        """Get personalized recommendations for a user using a hybrid approach"""
+        return self.get_recommendations_for_users([user], limit, db)[user.id]
+    
+    def get_recommendations_for_users(self, users: List[User], limit: int, db: Session) -> Dict[int, List[Movie]]:
+        """Get personalized recommendations for many users at once, keyed by user id"""
+        # Nothing to recommend from an empty catalog
+        if db.query(Movie.id).first() is None:
+            return {user.id: [] for user in users}
+        
+        results = {}
         
-        if not watched_movies:
-            # If no watch history, return popular movies
-            return db.query(Movie).order_by(Movie.vote_average.desc()).limit(limit).all()
+        # Users without watch history get the top rated movies
+        active_users = [user for user in users if user.watch_history]
+        if len(active_users) < len(users):
+            top_rated = db.query(Movie).order_by(Movie.vote_average.desc()).limit(limit).all()
+            for user in users:
+                if not user.watch_history:
+                    results[user.id] = top_rated
         
-        # Prepare content features if needed
-        cosine_sim, indices = self._prepare_content_features(all_movies)
+        if not active_users:
+            return results
         
-        # Get content-based recommendations for each watched movie
-        content_recommendations = []
-        for movie in watched_movies:
-            if movie.tmdb_id in indices:
-                recs = self._content_based_recommendations(movie.tmdb_id, cosine_sim, indices, all_movies, limit=5)
-                content_recommendations.extend(recs)
+        # Get collaborative recommendations from the factorisation model, falling back
+        # to neighbourhood filtering for users it hasn't been trained on yet
+        self.mf_model.reload_if_changed()
+        interactions = None
+        collab_tmdb_ids = {}
+        for user in active_users:
+            collab_tmdb_ids[user.id] = self.mf_model.recommend(user.id, limit=5)
+            if not collab_tmdb_ids[user.id]:
+                if interactions is None:
+                    interactions = load_interactions(db)
+                collab_tmdb_ids[user.id] = self._collaborative_filtering(user, db, limit=5, interactions=interactions)
         
-        # Get collaborative filtering recommendations
-        collab_recommendations = self._collaborative_filtering(user, all_movies, db, limit=5)
+        collab_movies = {
+            movie.tmdb_id: movie
+            for movie in self.load_movies_by_tmdb_id(db, list(set().union(*collab_tmdb_ids.values())))
+        }
         
+        # Load or build the content index if needed
+        self._ensure_content_index(db)
+        
+        # Score every user's whole watch history in one batch, excluding watched
+        # and collaborative picks so every content slot is a new movie
+        watched_ids = {user.id: set([movie.id for movie in user.watch_history]) for user in active_users}
+        collab_recommendations = {
+            user.id: [collab_movies[i] for i in collab_tmdb_ids[user.id] if i in collab_movies]
+            for user in active_users
+        }
+        content_ids = self._content_based_recommendations_batch(
+            [[movie.tmdb_id for movie in user.watch_history] for user in active_users],
+            limit=limit,
+            exclude_movie_ids=[
+                watched_ids[user.id] | set([movie.id for movie in collab_recommendations[user.id]])
+                for user in active_users
+            ]
+        )
+        content_movies = {movie.id: movie for movie in self._load_movies(db, set().union(*content_ids))}
+        
+        popular_movies = db.query(Movie).order_by(Movie.popularity.desc()).limit(limit).all()
+        
+        for user, user_content_ids in zip(active_users, content_ids):
+            results[user.id] = self._combine_recommendations(
+                watched_ids[user.id],
+                collab_recommendations[user.id],
+                [content_movies[i] for i in user_content_ids if i in content_movies],
+                popular_movies,
+                limit
+            )
+        
+        return results
+    
+    def _combine_recommendations(self, watched_ids, collab_recommendations, content_recommendations, popular_movies, limit):
+        """Merge the hybrid candidate lists for one user"""
         # Combine recommendations (hybrid approach)
         # Remove duplicates and already watched movies
-        watched_ids = set([movie.id for movie in watched_movies])
         recommended_ids = set()
         final_recommendations = []
         
@@ -158,7 +597,6 @@ class RecommendationService:
         
         # If we need more recommendations, add popular movies
         if len(final_recommendations) < limit:
-            popular_movies = db.query(Movie).order_by(Movie.popularity.desc()).limit(limit).all()
             for movie in popular_movies:
                 if movie.id not in watched_ids and movie.id not in recommended_ids:
                     recommended_ids.add(movie.id)
@@ -166,4 +604,87 @@ class RecommendationService:
                     if len(final_recommendations) >= limit:
                         break
         
-        return final_recommendations[:limit]
\ No newline at end of file
+        return final_recommendations[:limit]
+    
+    def _cache_key(self, user_id: int) -> str:
+        return f"recommendations:{user_id}:{self.model_version}"
+    
+    def get_cached_recommendations(self, user: User, limit: int, db: Session) -> List[Movie]:
+        """Personalized recommendations served from the per-user cache when possible"""
+        # Pick up a retrained model first so its version is part of the key
+        self.mf_model.reload_if_changed()
+        key = self._cache_key(user.id)
+        
+        cached = self.results_cache.get(key)
+        # A cached list shorter than its depth means the catalog ran out, so it serves any limit
+        if cached is not None and (len(cached["movie_ids"]) >= limit or len(cached["movie_ids"]) < cached["depth"]):
+            return self._load_movies(db, cached["movie_ids"][:limit])
+        
+        # Then the lists materialised by the batch job, one indexed read, as
+        # long as they were scored with the models serving now
+        materialized_ids = [
+            movie_id for (movie_id,) in db.query(UserRecommendation.movie_id).filter(
+                UserRecommendation.user_id == user.id,
+                UserRecommendation.model_version == self.model_version
+            ).order_by(UserRecommendation.rank).limit(limit).all()
+        ]
+        if materialized_ids and len(materialized_ids) >= limit:
+            return self._load_movies(db, materialized_ids)
+        
+        # New users and users whose activity changed since the batch run are scored online
+        depth = max(limit, self.CACHE_DEPTH)
+        recommendations = self._score_online(user, depth, db)
+        self.results_cache.set(key, {"depth": depth, "movie_ids": [movie.id for movie in recommendations]})
+        
+        return recommendations[:limit]
+    
+    def _score_online(self, user: User, limit: int, db: Session) -> List[Movie]:
+        """Score one user, in a worker process when the scoring pool is enabled"""
+        if self.scoring_pool is None:
+            return self.get_recommendations_for_user(user, limit, db)
+        
+        # Only this process builds and saves the index, workers load it from disk
+        # and catch up on movies saved since on their own
+        self._ensure_content_index(db)
+        results = self.scoring_pool.run(score_user_chunk, [user.id], limit)
+        if not results:
+            return []
+        [(_, movie_ids)] = results
+        return self._load_movies(db, movie_ids)
+    
+    def invalidate_user(self, user_id: int):
+        """Drop a user's cached and materialised results after their history, ratings or watchlist changed"""
+        self.results_cache.delete(self._cache_key(user_id))
+        
+        db = SessionLocal()
+        try:
+            db.query(UserRecommendation).filter(UserRecommendation.user_id == user_id).delete()
+            db.commit()
+        finally:
+            db.close()
+
+# Each worker process scores with its own service, loaded once from disk
+_worker_service: Optional[RecommendationService] = None
+
+def init_scoring_worker():
+    """Set up a worker process: fresh DB connections and the persisted models"""
+    global _worker_service
+    # Connections inherited from the parent must not be shared across processes
+    engine.dispose(close=False)
+    _worker_service = RecommendationService(read_only=True)
+    _worker_service.load_models()
+
+def score_user_chunk(user_ids: List[int], limit: int) -> List[Tuple[int, List[int]]]:
+    """Score a chunk of users in one batch, returns (user_id, [Movie.id, ...]) pairs"""
+    service = _worker_service or recommendation_service
+    db = SessionLocal()
+    try:
+        # Load every history in the chunk with one query rather than one lazy load per user
+        users = db.query(User).options(selectinload(User.watch_history)).filter(User.id.in_(user_ids)).all()
+        results = service.get_recommendations_for_users(users, limit, db)
+        return [(user_id, [movie.id for movie in movies]) for user_id, movies in results.items()]
+    finally:
+        db.close()
+
+# Create a singleton instance
+recommendation_service = RecommendationService()
\ No newline at end of file
@@ -0,0 +1,170 @@
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload
+from app.config import settings
+from app.models.database import SessionLocal
+from app.models.movie import Movie
+from app.services.text_index import Suggestion, TitleCompleter, TitleIndex
+from app.utils.executors import run_blocking
+import logging
+
+logger = logging.getLogger(__name__)
+
+class SearchResult(NamedTuple):
+    """A page of local search results in TMDB list shape"""
+    results: List[Dict]
+    total_results: int
+    all_words: int  # results with every query word, the rest only match some
+
+def _title_rows(db: Session, after_id: int = 0):
+    """Indexed columns of the movies past after_id, in id order"""
+    return (
+        db.query(Movie.id, Movie.tmdb_id, Movie.title, Movie.popularity, Movie.poster_path, Movie.release_date)
+        .filter(Movie.id > after_id)
+        .order_by(Movie.id)
+        .all()
+    )
+
+def _index_columns(rows):
+    """TitleIndex arguments for a list of title rows"""
+    return (
+        [row.id for row in rows],
+        [row.title for row in rows],
+        [row.popularity or 0.0 for row in rows],
+        [row.poster_path is not None for row in rows]
+    )
+
+def _completer_columns(rows):
+    """TitleCompleter arguments for a list of title rows, movies without a poster are never suggested"""
+    rows = [row for row in rows if row.poster_path is not None]
+    return (
+        [row.tmdb_id for row in rows],
+        [row.title for row in rows],
+        [row.release_date.year if row.release_date else None for row in rows],
+        [row.poster_path for row in rows],
+        [row.popularity or 0.0 for row in rows]
+    )
+
+class SearchService:
+    """Title search and autocomplete over the local catalog, answered from memory
+
+    A TitleIndex ranks searches and a TitleCompleter suggests titles as they
+    are typed. Both are built once at startup. Movies saved afterwards are
+    picked up by lookups, at most every search_index_sync_seconds, and
+    appended to the deltas of both. A full rebuild runs in the background
+    when the delta grows too large or the index too old. Readers take one
+    reference to an index per call, writers build a new one and swap it in.
+    """
+
+    def __init__(self):
+        self.index: Optional[TitleIndex] = None
+        self.completer: Optional[TitleCompleter] = None
+        self.last_update: Optional[datetime] = None
+        self._max_id = 0
+        self._synced_at = 0.0
+
+        # Catch-ups and background rebuilds are serialised, readers never take these
+        self._sync_lock = threading.Lock()
+        self._rebuild_lock = threading.Lock()
+
+    def build(self, db: Session) -> bool:
+        """Index every movie title in the database"""
+        try:
+            started = time.perf_counter()
+            rows = _title_rows(db)
+            index = TitleIndex.build(*_index_columns(rows))
+            completer = TitleCompleter.build(*_completer_columns(rows))
+        except Exception as e:
+            logger.error(f"Error building search index: {str(e)}")
+            return False
+
+        with self._sync_lock:
+            # Anything saved after the rows were read is picked up by the next catch-up
+            self.index = index
+            self.completer = completer
+            self._max_id = rows[-1].id if rows else 0
+            self._synced_at = 0.0
+            self.last_update = datetime.now()
+
+        logger.info(f"Built search index over {len(rows)} titles in {time.perf_counter() - started:.2f}s")
+        return True
+
+    def _catch_up(self, db: Session):
+        """Append movies saved since the last sync, new movies always get higher ids"""
+        if time.monotonic() - self._synced_at < settings.search_index_sync_seconds:
+            return
+        if not self._sync_lock.acquire(blocking=False):
+            return
+
+        try:
+            self._synced_at = time.monotonic()
+            rows = _title_rows(db, self._max_id)
+            if rows:
+                self.index = self.index.add(*_index_columns(rows))
+                self.completer = self.completer.add(*_completer_columns(rows))
+                self._max_id = rows[-1].id
+        finally:
+            self._sync_lock.release()
+
+        self._maybe_rebuild_in_background()
+
+    def _maybe_rebuild_in_background(self):
+        """Start a full rebuild when the delta is too large or the index too old"""
+        index = self.index
+        too_many = index.delta_size > settings.search_index_rebuild_delta
+        too_old = (
+            self.last_update is not None and
+            (datetime.now() - self.last_update).total_seconds() > settings.search_index_rebuild_interval_hours * 3600
+        )
+
+        if (too_many or too_old) and index.delta_size > 0:
+            self.rebuild_in_background()
+
+    def rebuild_in_background(self) -> bool:
+        """Rebuild the search index on a background thread, returns False if one is already running"""
+        if not self._rebuild_lock.acquire(blocking=False):
+            return False
+
+        def rebuild():
+            db = SessionLocal()
+            try:
+                self.build(db)
+            finally:
+                db.close()
+                self._rebuild_lock.release()
+
+        threading.Thread(target=rebuild, name="search-index-rebuild", daemon=True).start()
+        return True
+
+    async def search(self, db: AsyncSession, query: str, page: int = 1, page_size: int = 20, min_results: int = 1) -> Optional[SearchResult]:
+        """Rank local movies for a query, None if there is no index to answer it
+
+        Titles with every word of the query come first. When fewer than
+        min_results have them all, titles with any of the words are ranked too.
+        """
+        if self.index is None:
+            return None
+        await db.run_sync(self._catch_up)
+
+        match = await run_blocking(self.index.match, query, limit=page * page_size, min_results=min_results)
+        page_ids = match.movie_ids[(page - 1) * page_size:page * page_size]
+        if not page_ids:
+            return SearchResult([], match.total, match.all_words)
+
+        movies = (await db.execute(select(Movie).options(selectinload(Movie.genres)).where(Movie.id.in_(page_ids)))).scalars().all()
+        by_id = {movie.id: movie for movie in movies}
+        return SearchResult([by_id[i].to_dict() for i in page_ids if i in by_id], match.total, match.all_words)
+
+    async def autocomplete(self, db: AsyncSession, prefix: str, limit: int = 10) -> Optional[List[Suggestion]]:
+        """Most popular titles with a word starting with prefix, None if there is no index yet"""
+        if self.completer is None:
+            return None
+        await db.run_sync(self._catch_up)
+        return self.completer.complete(prefix, limit)
+
+# Create a singleton instance
+search_service = SearchService()
@@ -0,0 +1,464 @@
+import bisect
+import copy
+import re
+import unicodedata
+from collections import defaultdict
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+import numpy as np
+from app.utils.ranking import top_k_indices
+
+_WORD = re.compile(r"\w+")
+
+def normalize_text(value: str) -> str:
+    """Lowercase and strip accents, so Amélie and amelie are the same word"""
+    if not value or value.isascii():
+        return (value or "").lower()
+    decomposed = unicodedata.normalize("NFKD", value or "")
+    return "".join(char for char in decomposed if not unicodedata.combining(char)).lower()
+
+def tokenize(value: str) -> List[str]:
+    return _WORD.findall(normalize_text(value))
+
+def _trigrams(term: str) -> List[str]:
+    # Padded so short words still have a few grams and word starts weigh more
+    padded = f"  {term} "
+    return [padded[i:i + 3] for i in range(len(padded) - 2)]
+
+class TextMatch(NamedTuple):
+    """Ranked hits of a query, how many movies were ranked and how many had every query word"""
+    movie_ids: List[int]
+    total: int
+    all_words: int
+
+class TitleIndex:
+    """In-memory inverted index over movie titles with BM25 ranking
+
+    Terms are kept sorted, so a word being typed matches every term it is a
+    prefix of through a bisect. Words that are not in the vocabulary are
+    matched against similar terms found through a trigram index over the
+    vocabulary, which is far smaller than the titles, so typos still hit.
+    Postings are numpy arrays and scoring is vectorised over the documents.
+
+    Movies added after the build go to a small delta with postings of its
+    own, until the next build folds them into the main postings.
+    """
+
+    K1 = 1.2
+    B = 0.75
+    MAX_PREFIX_TERMS = 64  # most frequent completions of a prefix that are searched
+    MAX_CORRECTIONS = 5  # similar terms tried for a word that isn't in the vocabulary
+    MIN_SIMILARITY = 0.45  # trigram Dice similarity for a term to count as a typo of a word
+
+    def __init__(
+        self,
+        movie_ids: np.ndarray,
+        titles: List[str],
+        popularity: np.ndarray,
+        searchable: np.ndarray,
+        terms: List[str],
+        offsets: np.ndarray,
+        postings: np.ndarray,
+        doc_lengths: np.ndarray
+    ):
+        self.movie_ids = movie_ids  # row -> Movie.id
+        self.titles = titles  # row -> normalised title
+        self.popularity = popularity
+        self.searchable = searchable  # rows that may be returned, e.g. movies with a poster
+        self.terms = terms  # sorted vocabulary
+        self.offsets = offsets  # term -> start of its rows in postings
+        self.postings = postings
+        self.doc_freq = np.diff(offsets)
+        self.idf = np.log(1 + (len(movie_ids) - self.doc_freq + 0.5) / (self.doc_freq + 0.5)).astype(np.float32)
+
+        # With titles a term rarely repeats, so BM25 reduces to idf times a length norm
+        self.average_length = float(doc_lengths.mean()) if len(doc_lengths) else 1.0
+        self.length_norm = ((self.K1 + 1) / (1 + self.K1 * (1 - self.B + self.B * doc_lengths / self.average_length))).astype(np.float32)
+        self.removed = np.zeros(len(movie_ids), dtype=bool)  # rows superseded by the delta
+
+        # Movies added since the build, see add()
+        self.delta_ids = np.empty(0, dtype=np.int64)
+        self.delta_tokens: List[set] = []
+        self.delta_postings = {}  # token -> delta rows
+        self.delta_unseen: List[str] = []  # delta tokens missing from the vocabulary
+        self.delta_titles: List[str] = []
+        self.delta_popularity = np.empty(0, dtype=np.float32)
+        self.delta_searchable = np.empty(0, dtype=bool)
+        self.delta_length_norm = np.empty(0, dtype=np.float32)
+
+        self._term_ids = {term: i for i, term in enumerate(terms)}
+        grams = defaultdict(list)
+        for term_id, term in enumerate(terms):
+            for gram in set(_trigrams(term)):
+                grams[gram].append(term_id)
+        self._gram_terms = {gram: np.asarray(ids, dtype=np.int32) for gram, ids in grams.items()}
+        self._gram_counts = np.asarray([len(set(_trigrams(term))) for term in terms], dtype=np.int32)
+
+    @classmethod
+    def build(cls, movie_ids: Sequence[int], titles: Sequence[str], popularity: Sequence[float], searchable: Sequence[bool]) -> "TitleIndex":
+        postings = defaultdict(list)
+        doc_lengths = np.empty(len(titles), dtype=np.float32)
+        normalized = []
+        for row, title in enumerate(titles):
+            tokens = tokenize(title)
+            normalized.append(" ".join(tokens))
+            doc_lengths[row] = max(1, len(tokens))
+            for token in set(tokens):
+                postings[token].append(row)
+
+        terms = sorted(postings)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(postings[term]) for term in terms])
+        flat = np.fromiter((row for term in terms for row in postings[term]), dtype=np.int32, count=int(offsets[-1]))
+
+        return cls(
+            np.asarray(movie_ids, dtype=np.int64),
+            normalized,
+            np.nan_to_num(np.asarray(popularity, dtype=np.float32)),
+            np.asarray(searchable, dtype=bool),
+            terms,
+            offsets,
+            flat,
+            doc_lengths
+        )
+
+    def __len__(self) -> int:
+        return len(self.movie_ids) + len(self.delta_ids)
+
+    def _rows(self, term_id: int) -> np.ndarray:
+        return self.postings[self.offsets[term_id]:self.offsets[term_id + 1]]
+
+    def _prefix_terms(self, prefix: str) -> List[int]:
+        """Ids of the terms starting with prefix, the most frequent first"""
+        start = bisect.bisect_left(self.terms, prefix)
+        end = bisect.bisect_left(self.terms, prefix + "\uffff")
+        term_ids = np.arange(start, end)
+        if len(term_ids) > self.MAX_PREFIX_TERMS:
+            term_ids = term_ids[top_k_indices(self.doc_freq[term_ids], self.MAX_PREFIX_TERMS)]
+        return term_ids.tolist()
+
+    def _corrections(self, word: str) -> List[Tuple[int, float]]:
+        """Terms that look like a misspelling of word, with their trigram similarity"""
+        grams = set(_trigrams(word))
+        hits = [self._gram_terms[gram] for gram in grams if gram in self._gram_terms]
+        if not hits:
+            return []
+
+        term_ids, shared = np.unique(np.concatenate(hits), return_counts=True)
+        similarity = 2 * shared / (len(grams) + self._gram_counts[term_ids])
+        best = top_k_indices(similarity, self.MAX_CORRECTIONS)
+        return [(int(term_ids[i]), float(similarity[i])) for i in best if similarity[i] >= self.MIN_SIMILARITY]
+
+    def _expand(self, word: str, is_prefix: bool) -> List[Tuple[int, float]]:
+        """Terms a query word stands for, each with the idf it scores with"""
+        term_id = self._term_ids.get(word)
+        if is_prefix:
+            expansions = {}
+            for i in self._prefix_terms(word):
+                # A rare completion must not outrank the exact word typed so far
+                idf = self.idf[i] if term_id is None else min(self.idf[i], self.idf[term_id])
+                expansions[i] = 0.9 * float(idf)
+            if term_id is not None:
+                expansions[term_id] = float(self.idf[term_id])
+            if expansions:
+                return list(expansions.items())
+        elif term_id is not None:
+            return [(term_id, float(self.idf[term_id]))]
+
+        # A typo is worth less than the word it stands for
+        return [(i, 0.8 * similarity * float(self.idf[i])) for i, similarity in self._corrections(word)]
+
+    def _delta_scores(self, expansions: List[Tuple[str, bool, dict]]) -> Tuple[np.ndarray, np.ndarray]:
+        """Scores of the delta rows, through the delta's own small postings"""
+        scores = np.zeros(len(self.delta_ids), dtype=np.float32)
+        matched = np.zeros(len(self.delta_ids), dtype=np.int32)
+        unseen_idf = float(self.idf.max()) if len(self.idf) else 1.0
+
+        for word, is_prefix, term_idfs in expansions:
+            word_scores = np.zeros(len(self.delta_ids), dtype=np.float32)
+            matches = [
+                (self.delta_postings[self.terms[term_id]], idf)
+                for term_id, idf in term_idfs.items()
+                if self.terms[term_id] in self.delta_postings
+            ]
+            # Words the vocabulary doesn't have yet are as rare as it gets
+            for token in self.delta_unseen:
+                if token == word:
+                    matches.append((self.delta_postings[token], unseen_idf))
+                elif is_prefix and token.startswith(word):
+                    matches.append((self.delta_postings[token], 0.9 * unseen_idf))
+
+            for rows, idf in matches:
+                word_scores[rows] = np.maximum(word_scores[rows], idf * self.delta_length_norm[rows])
+            scores += word_scores
+            matched += word_scores > 0
+        return scores, matched
+
+    def match(self, query: str, limit: int, min_results: int = 1, popularity_weight: float = 0.3, prefix_boost: float = 0.5) -> TextMatch:
+        """Rank movies for a query, best first
+
+        Titles with every query word are preferred. When fewer than min_results
+        have them all, titles with any of the words are ranked as well. The last
+        word is treated as a prefix unless the query ends in a space.
+        """
+        words = list(dict.fromkeys(tokenize(query)))
+        if not words or not len(self):
+            return TextMatch([], 0, 0)
+        last_is_prefix = not query[-1:].isspace()
+
+        scores = np.zeros(len(self.movie_ids), dtype=np.float32)
+        matched = np.zeros(len(self.movie_ids), dtype=np.int32)
+        expansions = []
+        for position, word in enumerate(words):
+            is_prefix = last_is_prefix and position == len(words) - 1
+            term_idfs = dict(self._expand(word, is_prefix))
+            expansions.append((word, is_prefix, term_idfs))
+
+            word_scores = np.zeros(len(self.movie_ids), dtype=np.float32)
+            for term_id, idf in term_idfs.items():
+                rows = self._rows(term_id)
+                word_scores[rows] = np.maximum(word_scores[rows], idf * self.length_norm[rows])
+            scores += word_scores
+            matched += word_scores > 0
+
+        base = np.flatnonzero((matched > 0) & self.searchable & ~self.removed)
+        candidate_scores, candidate_matched = scores[base], matched[base]
+        candidate_popularity, candidate_ids = self.popularity[base], self.movie_ids[base]
+        delta = np.empty(0, dtype=np.int64)
+
+        # The delta is scored the same way, and joins the candidates
+        if len(self.delta_ids):
+            delta_scores, delta_matched = self._delta_scores(expansions)
+            delta = np.flatnonzero((delta_matched > 0) & self.delta_searchable)
+            candidate_scores = np.concatenate([candidate_scores, delta_scores[delta]])
+            candidate_matched = np.concatenate([candidate_matched, delta_matched[delta]])
+            candidate_popularity = np.concatenate([candidate_popularity, self.delta_popularity[delta]])
+            candidate_ids = np.concatenate([candidate_ids, self.delta_ids[delta]])
+
+        candidates = np.flatnonzero(candidate_matched == len(words))
+        all_words = len(candidates)
+        if all_words < min_results:
+            candidates = np.arange(len(candidate_ids))
+        if not len(candidates):
+            return TextMatch([], 0, 0)
+
+        # Scale text and popularity to [0, 1] over the candidates before mixing them
+        text_scores = candidate_scores[candidates]
+        final = text_scores / max(float(text_scores.max()), 1e-6)
+        popularity = np.log1p(np.maximum(candidate_popularity[candidates], 0))
+        final += popularity_weight * popularity / max(float(popularity.max()), 1e-6)
+
+        # Boost titles starting with the query among the best, checking every candidate costs too much
+        shortlist = top_k_indices(final, max(limit * 4, 50))
+        prefix = " ".join(words)
+        for i in shortlist:
+            position = candidates[i]
+            title = self.titles[base[position]] if position < len(base) else self.delta_titles[delta[position - len(base)]]
+            if title.startswith(prefix):
+                final[i] += prefix_boost
+
+        best = top_k_indices(final, limit)
+        return TextMatch([int(i) for i in candidate_ids[candidates[best]]], len(candidates), all_words)
+
+    @property
+    def delta_size(self) -> int:
+        return len(self.delta_ids)
+
+    def add(self, movie_ids: Sequence[int], titles: Sequence[str], popularity: Sequence[float], searchable: Sequence[bool]) -> "TitleIndex":
+        """Return a copy of the index with movies added to its delta
+
+        Rows already indexed for the same movies are hidden, so this also
+        updates titles. The built postings are shared with the copy, readers of
+        the original are never affected. Costs O(delta), the delta is meant to
+        be folded in by a rebuild once it grows.
+        """
+        index = copy.copy(self)
+        movie_ids = np.asarray(movie_ids, dtype=np.int64)
+        index.removed = self.removed | np.isin(self.movie_ids, movie_ids)
+
+        keep = np.flatnonzero(~np.isin(self.delta_ids, movie_ids))
+        tokens = [tokenize(title) for title in titles]
+        lengths = np.asarray([max(1, len(words)) for words in tokens], dtype=np.float32)
+
+        index.delta_ids = np.concatenate([self.delta_ids[keep], movie_ids])
+        delta_tokens = [self.delta_tokens[i] for i in keep] + [set(words) for words in tokens]
+        index.delta_tokens = delta_tokens
+        postings = defaultdict(list)
+        for row, words in enumerate(delta_tokens):
+            for word in words:
+                postings[word].append(row)
+        index.delta_postings = {word: np.asarray(rows, dtype=np.int64) for word, rows in postings.items()}
+        index.delta_unseen = [word for word in postings if word not in self._term_ids]
+        index.delta_titles = [self.delta_titles[i] for i in keep] + [" ".join(words) for words in tokens]
+        index.delta_popularity = np.concatenate([
+            self.delta_popularity[keep],
+            np.nan_to_num(np.asarray(popularity, dtype=np.float32))
+        ])
+        index.delta_searchable = np.concatenate([self.delta_searchable[keep], np.asarray(searchable, dtype=bool)])
+        index.delta_length_norm = np.concatenate([
+            self.delta_length_norm[keep],
+            ((self.K1 + 1) / (1 + self.K1 * (1 - self.B + self.B * lengths / self.average_length))).astype(np.float32)
+        ])
+        return index
+
+class Suggestion(NamedTuple):
+    """A title suggested for a prefix, id is the TMDB id"""
+    id: int
+    title: str
+    year: Optional[int]
+    poster_path: Optional[str]
+
+class TitleCompleter:
+    """Prefix completion of movie titles, most popular first
+
+    Every title is entered once per word it contains, from that word to the
+    end, so "mat" completes "The Matrix" as well as "Matilda". The keys are
+    kept in one sorted list and a prefix is the range of keys a bisect finds.
+    Prefixes matching many keys get their top movies precomputed, every other
+    range is small enough to rank when it is asked for, so a lookup never
+    touches more than HEAVY_NODE keys.
+
+    New movies go to a delta completer, rebuilt from its own few rows on each
+    add, until the next build folds them in.
+    """
+
+    TOP_K = 10  # suggestions precomputed per prefix, the most a lookup returns
+    HEAVY_NODE = 64  # prefixes matching more keys than this are precomputed
+
+    def __init__(
+        self,
+        tmdb_ids: np.ndarray,
+        titles: List[str],
+        years: List[Optional[int]],
+        posters: List[Optional[str]],
+        popularity: np.ndarray,
+        keys: List[str],
+        key_rows: np.ndarray
+    ):
+        self.tmdb_ids = tmdb_ids  # row -> TMDB id
+        self.titles = titles
+        self.years = years
+        self.posters = posters
+        self.popularity = popularity
+        self.keys = keys  # sorted title suffixes, one per word, each ending in a space
+        self.key_rows = key_rows  # key -> row
+        self.key_popularity = popularity[key_rows]
+        self.delta: Optional["TitleCompleter"] = None
+        self.top = self._precompute()
+
+    @classmethod
+    def build(
+        cls,
+        tmdb_ids: Sequence[int],
+        titles: Sequence[str],
+        years: Sequence[Optional[int]],
+        posters: Sequence[Optional[str]],
+        popularity: Sequence[float]
+    ) -> "TitleCompleter":
+        keys, key_rows = [], []
+        for row, title in enumerate(titles):
+            tokens = tokenize(title)
+            for i in range(len(tokens)):
+                # A trailing space ends the last word too, so "matrix " completes "The Matrix" itself
+                keys.append(" ".join(tokens[i:]) + " ")
+                key_rows.append(row)
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+
+        return cls(
+            np.asarray(tmdb_ids, dtype=np.int64),
+            list(titles),
+            list(years),
+            list(posters),
+            np.nan_to_num(np.asarray(popularity, dtype=np.float32)),
+            [keys[i] for i in order],
+            np.asarray(key_rows, dtype=np.int64)[order]
+        )
+
+    def __len__(self) -> int:
+        return len(self.tmdb_ids) + (len(self.delta) if self.delta is not None else 0)
+
+    def _best_rows(self, start: int, end: int, limit: int) -> List[int]:
+        """The most popular distinct rows among keys[start:end]"""
+        # A title can hold the prefix at more than one word, take extra before removing repeats
+        best = start + top_k_indices(self.key_popularity[start:end], limit * 2)
+        return list(dict.fromkeys(self.key_rows[best].tolist()))[:limit]
+
+    def _precompute(self) -> Dict[str, List[int]]:
+        """Top rows of every prefix matching more than HEAVY_NODE keys, walking down from the root"""
+        top = {}
+        stack = [("", 0, len(self.keys))]
+        while stack:
+            prefix, start, end = stack.pop()
+            if prefix:
+                top[prefix] = self._best_rows(start, end, self.TOP_K)
+
+            # The key equal to the prefix sorts first, the rest split by their next character
+            depth = len(prefix)
+            position = start
+            while position < end and len(self.keys[position]) == depth:
+                position += 1
+            while position < end:
+                child = prefix + self.keys[position][depth]
+                child_end = bisect.bisect_left(self.keys, child + "\uffff", position, end)
+                if child_end - position > self.HEAVY_NODE:
+                    stack.append((child, position, child_end))
+                position = child_end
+        return top
+
+    def _rows(self, prefix: str, limit: int) -> List[int]:
+        if prefix in self.top:
+            return self.top[prefix][:limit]
+        start = bisect.bisect_left(self.keys, prefix)
+        end = bisect.bisect_left(self.keys, prefix + "\uffff", start)
+        return self._best_rows(start, end, limit)
+
+    def _suggestion(self, row: int) -> Suggestion:
+        return Suggestion(int(self.tmdb_ids[row]), self.titles[row], self.years[row], self.posters[row])
+
+    def complete(self, prefix: str, limit: int = TOP_K) -> List[Suggestion]:
+        """Titles with a word starting with prefix, most popular first
+
+        A trailing space in prefix means its last word is complete.
+        """
+        words = tokenize(prefix)
+        if not words:
+            return []
+        key = " ".join(words) + (" " if prefix[-1:].isspace() else "")
+        limit = min(limit, self.TOP_K)
+
+        ranked = [(float(self.popularity[row]), self, row) for row in self._rows(key, limit)]
+        if self.delta is not None:
+            ranked += [(float(self.delta.popularity[row]), self.delta, row) for row in self.delta._rows(key, limit)]
+            ranked.sort(key=lambda item: item[0], reverse=True)
+
+        suggestions = {}
+        for _, completer, row in ranked:
+            suggestion = completer._suggestion(row)
+            suggestions.setdefault(suggestion.id, suggestion)
+        return list(suggestions.values())[:limit]
+
+    def add(
+        self,
+        tmdb_ids: Sequence[int],
+        titles: Sequence[str],
+        years: Sequence[Optional[int]],
+        posters: Sequence[Optional[str]],
+        popularity: Sequence[float]
+    ) -> "TitleCompleter":
+        """Return a copy of the completer with movies added to its delta, the original is left as is"""
+        completer = copy.copy(self)
+        delta = self.delta
+        if delta is None:
+            completer.delta = TitleCompleter.build(tmdb_ids, titles, years, posters, popularity)
+        else:
+            completer.delta = TitleCompleter.build(
+                np.concatenate([delta.tmdb_ids, np.asarray(tmdb_ids, dtype=np.int64)]),
+                delta.titles + list(titles),
+                delta.years + list(years),
+                delta.posters + list(posters),
+                np.concatenate([delta.popularity, np.asarray(popularity, dtype=np.float32)])
+            )
+        return completer
+
+    @property
+    def delta_size(self) -> int:
+        return len(self.delta) if self.delta is not None else 0
@@ -1,8 +1,15 @@
-import requests
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterable, NamedTuple, Optional
+import asyncio
+import json
 import os
+import random
+import time
+from email.utils import parsedate_to_datetime
 from dotenv import load_dotenv
 from app.config import settings
+from app.utils.cache import LRUCache, SQLiteCache, TieredCache
+from app.utils.executors import run_blocking
+from app.utils.rate_limit import CircuitBreaker, CircuitOpenError, TokenBucket
 import httpx
 import logging
 
@@ -10,85 +17,329 @@ logger = logging.getLogger(__name__)
 
 load_dotenv()
 
+class BulkResult(NamedTuple):
+    """Outcome of a bulk fetch, both keyed by TMDB id"""
+    results: Dict[int, Dict]  # in the order the ids were requested
+    errors: Dict[int, str]
+
 class TMDBService:
     BASE_URL = "https://api.themoviedb.org/3"
     
+    # Seconds a cached response is fresh for, per kind of endpoint
+    CACHE_TTLS = {
+        "genres": 7 * 24 * 3600,
+        "details": 24 * 3600,
+        "similar": 24 * 3600,
+        "recommendations": 24 * 3600,
+        "discover": 3600,
+        "popular": 10 * 60,
+        "search": 10 * 60,
+    }
+    
     def __init__(self):
         self.api_key = settings.tmdb_api_key
         self.access_token = settings.tmdb_access_token
         self.base_url = settings.tmdb_base_url
+        
+        # One pooled client shared by every request, opened and closed in the app lifespan
+        self._client: Optional[httpx.AsyncClient] = None
+        
+        # Response cache: in-memory LRU in front of an optional SQLite file
+        self.cache_ttls = {**self.CACHE_TTLS, **settings.tmdb_cache_ttls}
+        self.cache = TieredCache(
+            LRUCache(maxsize=settings.tmdb_cache_size),
+            SQLiteCache(settings.tmdb_cache_path) if settings.tmdb_cache_path else None
+        )
+        self.cache_stats = {"hits": 0, "stale_hits": 0, "misses": 0, "refreshes": 0, "refresh_errors": 0}
+        
+        # Single-flight: at most one upstream request per key, concurrent callers share it
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self._background_tasks = set()
+        self.flight_stats = {"upstream": 0, "coalesced": 0}
+        
+        # Shared by every call: stay under TMDB's rate limit and stop calling it while it is down
+        self.rate_limiter = TokenBucket(settings.tmdb_rate_limit_per_second, settings.tmdb_rate_limit_burst)
+        self.circuit = CircuitBreaker(settings.tmdb_circuit_failure_threshold, settings.tmdb_circuit_reset_seconds)
+        self.retry_stats = {"retries": 0, "rate_limited": 0, "server_errors": 0, "network_errors": 0}
     
-    def _make_request(self, endpoint: str, params: Dict[str, Any] = None) -> Dict:
-        """Make a request to the TMDB API"""
-        url = f"{self.base_url}{endpoint}"
-        headers = {
-            "Authorization": f"Bearer {self.access_token}",
-            "Content-Type": "application/json;charset=utf-8"
-        }
+    def _create_client(self) -> httpx.AsyncClient:
+        """Create the pooled HTTP/2 keep-alive client"""
+        return httpx.AsyncClient(
+            base_url=self.base_url,
+            headers={
+                "Authorization": f"Bearer {self.access_token}",
+                "Content-Type": "application/json;charset=utf-8"
+            },
+            http2=settings.tmdb_http2,
+            limits=httpx.Limits(
+                max_connections=settings.tmdb_max_connections,
+                max_keepalive_connections=settings.tmdb_max_keepalive_connections,
+                keepalive_expiry=settings.tmdb_keepalive_expiry_seconds
+            ),
+            timeout=httpx.Timeout(settings.tmdb_timeout_seconds, connect=settings.tmdb_connect_timeout_seconds)
+        )
+    
+    async def start(self):
+        """Open the shared client, called on app startup"""
+        if self._client is None:
+            self._client = self._create_client()
+    
+    async def close(self):
+        """Close the shared client and its connections, called on app shutdown"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+    
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Scripts and CLI jobs run outside the app lifespan, so open lazily for them
+        if self._client is None:
+            self._client = self._create_client()
+        return self._client
+    
+    def _backoff(self, attempt: int) -> float:
+        """Exponential backoff with full jitter, so retries from many callers spread out"""
+        return random.uniform(0, min(settings.tmdb_backoff_max_seconds, settings.tmdb_backoff_base_seconds * 2 ** attempt))
+    
+    def _retry_after(self, response: httpx.Response) -> Optional[float]:
+        """Seconds to wait from a Retry-After header, given either as seconds or as an HTTP date"""
+        value = response.headers.get("Retry-After")
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+    
+    async def _fetch(self, endpoint: str, params: Dict[str, Any] = None) -> Dict:
+        """Fetch a response from the TMDB API, bypassing the cache
+        
+        Every attempt takes a token from the shared rate limiter. 429s are retried
+        after their Retry-After, 5xx and network errors with jittered exponential
+        backoff. Calls fail fast with CircuitOpenError while TMDB is down.
+        """
+        is_trial = self.circuit.state == CircuitBreaker.HALF_OPEN
+        if not self.circuit.allow_request():
+            raise CircuitOpenError(f"TMDB unavailable, not calling {endpoint}")
         
+        try:
+            return await self._fetch_with_retries(endpoint, params)
+        finally:
+            # A trial ended by anything else, a bad body or a cancellation, must not keep the circuit shut
+            if is_trial:
+                self.circuit.release_trial()
+    
+    async def _fetch_with_retries(self, endpoint: str, params: Dict[str, Any] = None) -> Dict:
         # Add API key to params
-        params = params or {}
+        params = dict(params or {})
         params["api_key"] = self.api_key
         
-        try:
-            response = requests.get(url, headers=headers, params=params)
-            response.raise_for_status()
-            return response.json()
-        except requests.RequestException as e:
-            logger.error(f"TMDB API error: {str(e)}")
-            raise
-
-    def get_popular_movies(self, page: int = 1) -> Dict:
+        attempt = 0
+        while True:
+            await self.rate_limiter.acquire()
+            try:
+                response = await self.client.get(endpoint, params=params)
+                if response.status_code < 500 and response.status_code != 429:
+                    # Client errors such as 404 mean TMDB itself is healthy
+                    self.circuit.record_success()
+                    response.raise_for_status()
+                    return response.json()
+                
+                if response.status_code == 429:
+                    self.retry_stats["rate_limited"] += 1
+                    retry_after = self._retry_after(response)
+                    delay = self._backoff(attempt) if retry_after is None else retry_after
+                    # Everyone waits, not just this request, but never longer than any backoff would
+                    self.rate_limiter.pause(min(delay, settings.tmdb_backoff_max_seconds))
+                else:
+                    self.retry_stats["server_errors"] += 1
+                    delay = self._backoff(attempt)
+                response.raise_for_status()
+            except httpx.HTTPStatusError as e:
+                error = e
+                if e.response.status_code < 500 and e.response.status_code != 429:
+                    logger.error(f"TMDB API error: {str(e)}")
+                    raise
+            except httpx.TransportError as e:
+                self.retry_stats["network_errors"] += 1
+                error = e
+                delay = self._backoff(attempt)
+            
+            if attempt >= settings.tmdb_max_retries or delay > settings.tmdb_backoff_max_seconds:
+                self.circuit.record_failure()
+                logger.error(f"TMDB API error after {attempt + 1} attempts: {str(error)}")
+                raise error
+            
+            attempt += 1
+            self.retry_stats["retries"] += 1
+            logger.warning(f"TMDB request to {endpoint} failed ({str(error)}), retry {attempt} in {delay:.2f}s")
+            await asyncio.sleep(delay)
+    
+    def _cache_key(self, endpoint: str, params: Dict[str, Any] = None) -> str:
+        return f"{endpoint}?{json.dumps(params or {}, sort_keys=True, default=str)}"
+    
+    async def _single_flight(self, key: str, fetch) -> Dict:
+        """Run fetch() at most once per key at a time, every concurrent caller awaits the same result"""
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fetch())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._in_flight.pop(key, None) if self._in_flight.get(key) is done else None)
+            self.flight_stats["upstream"] += 1
+        else:
+            self.flight_stats["coalesced"] += 1
+        
+        # Shield the shared request so one caller going away doesn't cancel it for the others
+        return await asyncio.shield(task)
+    
+    async def _make_request(self, endpoint: str, params: Dict[str, Any] = None, cache: Optional[str] = None) -> Dict:
+        """Make a request to the TMDB API, through the response cache when a cache kind is given
+        
+        Fresh entries are served directly. Entries past their TTL but within the
+        stale window are served immediately while a background task refreshes them.
+        Concurrent misses for the same request share one upstream call.
+        Stale entries keep being served while the circuit to TMDB is open.
+        """
+        key = self._cache_key(endpoint, params)
+        if cache is None:
+            return await self._single_flight(key, lambda: self._fetch(endpoint, params))
+        
+        ttl = self.cache_ttls[cache]
+        entry = self.cache.memory.get(key)
+        if entry is None and self.cache.disk is not None:
+            # The disk tier is a blocking sqlite3 call, keep it off the event loop
+            entry = await run_blocking(self.cache.get_from_disk, key)
+        
+        if entry is not None:
+            age = time.time() - entry["fetched_at"]
+            if age < ttl:
+                self.cache_stats["hits"] += 1
+                return entry["data"]
+            
+            self.cache_stats["stale_hits"] += 1
+            # While TMDB is down the stale copy is the best answer, don't queue refreshes behind it
+            if self.circuit.state != CircuitBreaker.OPEN:
+                self._refresh_in_background(key, endpoint, params, ttl)
+            return entry["data"]
+        
+        self.cache_stats["misses"] += 1
+        return await self._single_flight(key, lambda: self._fetch_and_store(key, endpoint, params, ttl))
+    
+    async def _fetch_and_store(self, key: str, endpoint: str, params: Dict[str, Any], ttl: float) -> Dict:
+        data = await self._fetch(endpoint, params)
+        # Keep entries past their TTL for the stale window, so they can be served while refreshing
+        entry, ttl = {"fetched_at": time.time(), "data": data}, ttl * (1 + settings.tmdb_cache_stale_factor)
+        if self.cache.disk is not None:
+            await run_blocking(self.cache.set, key, entry, ttl)
+        else:
+            self.cache.set(key, entry, ttl)
+        return data
+    
+    def _refresh_in_background(self, key: str, endpoint: str, params: Dict[str, Any], ttl: float):
+        """Refetch a stale entry without making the caller wait, skipped if it is already being fetched"""
+        if key in self._in_flight:
+            return
+        
+        async def refresh():
+            try:
+                await self._single_flight(key, lambda: self._fetch_and_store(key, endpoint, params, ttl))
+                self.cache_stats["refreshes"] += 1
+            except Exception as e:
+                self.cache_stats["refresh_errors"] += 1
+                logger.warning(f"Background refresh of {endpoint} failed: {str(e)}")
+        
+        task = asyncio.create_task(refresh())
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+    
+    def stats(self) -> Dict:
+        """Cache, request, rate limiter and circuit breaker counters"""
+        return {
+            "cache": {**self.cache_stats, "tiers": self.cache.stats()},
+            "requests": {**self.flight_stats, **self.retry_stats, "in_flight": len(self._in_flight)},
+            "rate_limiter": self.rate_limiter.stats(),
+            "circuit": self.circuit.stats()
+        }
+    
+    async def get_popular_movies(self, page: int = 1) -> Dict:
         """Get popular movies"""
-        return self._make_request("/movie/popular", {"page": page})
+        return await self._make_request("/movie/popular", {"page": page}, cache="popular")
     
-    def get_movie_details(self, movie_id: int) -> Dict:
+    async def get_movie_details(self, movie_id: int) -> Dict:
         """Get details for a specific movie"""
-        return self._make_request(f"/movie/{movie_id}")
+        return await self._make_request(f"/movie/{movie_id}", cache="details")
+    
+    async def get_movie_details_many(self, movie_ids: Iterable[int], concurrency: Optional[int] = None) -> BulkResult:
+        """Get details for many movies concurrently
+        
+        At most `concurrency` requests are in flight at once, on top of the shared
+        rate limiter. Cached ids are answered without touching the network. One
+        failing id doesn't fail the batch, it is reported in errors instead.
+        """
+        movie_ids = list(dict.fromkeys(movie_ids))
+        semaphore = asyncio.Semaphore(concurrency or settings.tmdb_bulk_concurrency)
+        
+        async def fetch(movie_id: int) -> Dict:
+            async with semaphore:
+                return await self.get_movie_details(movie_id)
+        
+        responses = await asyncio.gather(*(fetch(movie_id) for movie_id in movie_ids), return_exceptions=True)
+        
+        results, errors = {}, {}
+        for movie_id, response in zip(movie_ids, responses):
+            if isinstance(response, Exception):
+                errors[movie_id] = str(response) or type(response).__name__
+            else:
+                results[movie_id] = response
+        
+        if errors:
+            logger.warning(f"Failed to fetch details for {len(errors)} of {len(movie_ids)} movies")
+        return BulkResult(results, errors)
     
-    def search_movies(self, query: str, page: int = 1) -> Dict:
+    async def search_movies(self, query: str, page: int = 1) -> Dict:
         """Search for movies by title"""
         params = {
             "query": query,
             "page": page,
             "include_adult": False
         }
-        return self._make_request("/search/movie", params)
+        return await self._make_request("/search/movie", params, cache="search")
     
-    def get_movie_recommendations(self, movie_id: int) -> Dict:
+    async def get_movie_recommendations(self, movie_id: int) -> Dict:
         """Get recommendations for a movie"""
-        return self._make_request(f"/movie/{movie_id}/recommendations")
+        return await self._make_request(f"/movie/{movie_id}/recommendations", cache="recommendations")
     
-    def get_movie_genres(self) -> Dict:
+    async def get_movie_genres(self) -> Dict:
         """Get all movie genres"""
-        return self._make_request("/genre/movie/list")
+        return await self._make_request("/genre/movie/list", cache="genres")
     
-    def discover_movies(self, params: Dict[str, Any]) -> Dict:
+    async def discover_movies(self, params: Dict[str, Any]) -> Dict:
         """Discover movies with filters"""
-        return self._make_request("/discover/movie", params)
-
-    def get_similar_movies(self, movie_id: int) -> Dict:
+        return await self._make_request("/discover/movie", params, cache="discover")
+    
+    async def get_similar_movies(self, movie_id: int) -> Dict:
         """Get similar movies based on movie ID"""
-        return self._make_request(f"/movie/{movie_id}/similar")
+        return await self._make_request(f"/movie/{movie_id}/similar", cache="similar")
     
     async def get_movies_by_genre(self, genre_id: int, page: int = 1) -> dict:
         """Get movies by genre ID from TMDB"""
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    f"{self.base_url}/discover/movie",
-                    params={
-                        "api_key": self.api_key,
-                        "with_genres": genre_id,
-                        "language": "en-US",
-                        "sort_by": "popularity.desc",
-                        "include_adult": False,
-                        "page": page
-                    }
-                )
-                response.raise_for_status()
-                return response.json()
-                
+            return await self._make_request(
+                "/discover/movie",
+                {
+                    "with_genres": genre_id,
+                    "language": "en-US",
+                    "sort_by": "popularity.desc",
+                    "include_adult": False,
+                    "page": page
+                },
+                cache="discover"
+            )
+        
         except httpx.RequestError as e:
             logger.error(f"TMDB API error: {str(e)}")
             raise Exception(f"Failed to fetch movies: {str(e)}")
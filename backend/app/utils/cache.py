@@ -0,0 +1,188 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+class LRUCache:
+    """Thread-safe in-memory LRU cache with a size bound and a per-entry TTL"""
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or (entry[0] is not None and entry[0] < time.time()):
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        with self._lock:
+            self._data[key] = (time.time() + ttl if ttl else None, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        return {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+class SQLiteCache:
+    """JSON values in a SQLite file with a per-entry TTL, survives restarts
+
+    Expired rows are deleted by a write at most every purge_interval seconds.
+    """
+
+    def __init__(self, path: str, ttl: Optional[float] = None, purge_interval: float = 300.0):
+        self.path = path
+        self.ttl = ttl
+        self.purge_interval = purge_interval
+        self._lock = threading.Lock()
+        self._purged_at = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+        )
+
+    def get_entry(self, key) -> Optional[Tuple[Optional[float], Any]]:
+        """(expires_at, value) of a live entry, None on a miss"""
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires_at FROM cache WHERE key = ?", (str(key),)).fetchone()
+            if row is None or (row[1] is not None and row[1] < time.time()):
+                self.misses += 1
+                return None
+
+            self.hits += 1
+        return row[1], json.loads(row[0])
+
+    def get(self, key, default=None):
+        entry = self.get_entry(key)
+        return default if entry is None else entry[1]
+
+    def set(self, key, value: Any, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        payload = json.dumps(value)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (str(key), payload, time.time() + ttl if ttl else None)
+            )
+            if time.monotonic() - self._purged_at >= self.purge_interval:
+                self._purge_expired()
+
+    def delete(self, key):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE key = ?", (str(key),))
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache")
+
+    def _purge_expired(self) -> int:
+        self._purged_at = time.monotonic()
+        return self._conn.execute("DELETE FROM cache WHERE expires_at < ?", (time.time(),)).rowcount
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            return self._purge_expired()
+
+    def stats(self) -> dict:
+        return {"path": self.path, "hits": self.hits, "misses": self.misses}
+
+class TieredCache:
+    """An in-memory LRU in front of an optional on-disk tier
+
+    Reads check memory first and promote disk hits into memory. Writes and
+    deletes go to both tiers. Values must be JSON-serialisable when a disk
+    tier is configured.
+    """
+
+    _MISSING = object()
+
+    def __init__(self, memory: LRUCache, disk: Optional[SQLiteCache] = None):
+        self.memory = memory
+        self.disk = disk
+
+    def get(self, key, default=None):
+        value = self.memory.get(key, self._MISSING)
+        if value is not self._MISSING:
+            return value
+        return self.get_from_disk(key, default)
+
+    def get_from_disk(self, key, default=None):
+        """Read only the disk tier and promote a hit, for callers that check memory themselves"""
+        if self.disk is not None:
+            entry = self.disk.get_entry(key)
+            if entry is not None:
+                # Promoted entries keep their expiry, memory never serves them past it
+                expires_at, value = entry
+                ttl = None
+                if expires_at is not None:
+                    ttl = max(expires_at - time.time(), 1e-3)
+                    if self.memory.ttl:
+                        ttl = min(ttl, self.memory.ttl)
+                self.memory.set(key, value, ttl)
+                return value
+
+        return default
+
+    def set(self, key, value, ttl: Optional[float] = None):
+        self.memory.set(key, value, ttl)
+        if self.disk is not None:
+            try:
+                self.disk.set(key, value, ttl)
+            except (sqlite3.Error, TypeError, ValueError) as e:
+                logger.warning(f"Disk cache write failed for {key}: {str(e)}")
+
+    def delete(self, key):
+        self.memory.delete(key)
+        if self.disk is not None:
+            self.disk.delete(key)
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self) -> dict:
+        return {
+            "memory": self.memory.stats(),
+            "disk": self.disk.stats() if self.disk is not None else None
+        }
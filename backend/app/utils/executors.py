@@ -0,0 +1,111 @@
+"""Where blocking work runs, so async handlers never stall the event loop
+
+Handlers await network I/O directly. Blocking calls, SQLAlchemy sessions,
+file I/O and anything else that may hold the thread for more than a
+millisecond or two, go through run_blocking onto one sized thread pool.
+That pool is also the loop's default executor, and FastAPI runs sync
+dependencies and endpoints on a limiter of the same size. CPU-bound
+scoring goes to a BoundedProcessPool, so it doesn't hold the GIL either.
+"""
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, Optional
+import anyio.to_thread
+from app.config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+blocking_executor = ThreadPoolExecutor(max_workers=settings.blocking_io_threads, thread_name_prefix="blocking")
+
+async def run_blocking(func: Callable, *args, **kwargs) -> Any:
+    """Run a blocking call on the blocking pool and await its result"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(blocking_executor, partial(func, *args, **kwargs))
+
+def configure_event_loop():
+    """Route the loop's default executor and FastAPI's threadpool through the blocking pool size"""
+    asyncio.get_running_loop().set_default_executor(blocking_executor)
+    anyio.to_thread.current_default_thread_limiter().total_tokens = settings.blocking_io_threads
+
+class BoundedProcessPool:
+    """A process pool that takes at most max_pending jobs at once
+
+    Submitting past the bound waits for a slot instead of queueing without
+    limit, so a burst of requests can't pile up work faster than the workers
+    clear it. Workers are spawned rather than forked, the server process has
+    threads and open connections a fork would copy, and only on first use.
+    """
+
+    def __init__(self, max_workers: int, max_pending: int, initializer: Optional[Callable] = None):
+        self.max_workers = max_workers
+        self.max_pending = max(max_pending, max_workers)
+        self.initializer = initializer
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.pending = 0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=self.initializer
+                )
+            return self._executor
+
+    def submit(self, func: Callable, *args) -> Future:
+        """Submit a job, blocking while max_pending jobs are in flight"""
+        self._slots.acquire()
+        try:
+            future = self._get_executor().submit(func, *args)
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self.submitted += 1
+            self.pending += 1
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, future: Future):
+        with self._lock:
+            self.pending -= 1
+        self._slots.release()
+
+    def run(self, func: Callable, *args) -> Any:
+        """Run a job and wait for its result, for callers already off the event loop"""
+        return self.submit(func, *args).result()
+
+    async def run_async(self, func: Callable, *args) -> Any:
+        """Run a job from the event loop, waiting for a slot on the blocking pool"""
+        future = await run_blocking(self.submit, func, *args)
+        return await asyncio.wrap_future(future)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "workers": self.max_workers,
+            "max_pending": self.max_pending,
+            "pending": self.pending,
+            "submitted": self.submitted
+        }
+
+def executor_stats() -> Dict[str, Any]:
+    """Queue depth of the blocking pool"""
+    return {
+        "blocking_threads": settings.blocking_io_threads,
+        "blocking_queued": blocking_executor._work_queue.qsize()
+    }
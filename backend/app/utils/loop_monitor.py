@@ -0,0 +1,82 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Dict, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+class LoopLagMonitor:
+    """Debug aid that reports the code blocking the event loop
+
+    A task on the loop records a heartbeat every interval. A watchdog thread
+    checks the heartbeat, and when the loop has missed it for longer than
+    threshold it logs the loop thread's current stack, taken from
+    sys._current_frames(), once per stall. That stack ends in the handler
+    holding the loop. Lag, how late each heartbeat ran, is kept as well.
+    """
+
+    def __init__(self, threshold: float = 0.1, interval: Optional[float] = None):
+        self.threshold = threshold
+        self.interval = interval or threshold / 4
+        self.stalls = 0
+        self.max_lag = 0.0
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stop = threading.Event()
+
+    async def _beat(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self.max_lag = max(self.max_lag, now - expected)
+            self._heartbeat = now
+
+    def _watch(self):
+        reported = None
+        while not self._stop.wait(self.interval):
+            heartbeat = self._heartbeat
+            blocked = time.monotonic() - heartbeat
+            # Report each stall once, while it is still happening
+            if blocked < self.threshold or heartbeat == reported:
+                continue
+            reported = heartbeat
+            self.stalls += 1
+
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            # Take the stack once, the frames unwind as soon as the loop moves on
+            stack = traceback.extract_stack(frame)
+            logger.warning(f"Event loop blocked for {blocked * 1000:.0f}ms in {self._handler(stack)}\n{''.join(stack.format())}")
+
+    @staticmethod
+    def _handler(stack: traceback.StackSummary) -> str:
+        """The innermost application frame of a stack, outside third party code"""
+        for summary in reversed(stack):
+            if "site-packages" not in summary.filename and f"{os.sep}app{os.sep}" in summary.filename:
+                return f"{summary.name} ({summary.filename}:{summary.lineno})"
+        return f"{stack[-1].name} ({stack[-1].filename}:{stack[-1].lineno})" if stack else "unknown code"
+
+    def start(self):
+        """Start monitoring the running loop"""
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.get_running_loop().create_task(self._beat())
+        threading.Thread(target=self._watch, name="loop-lag-watchdog", daemon=True).start()
+        logger.info(f"Reporting event loop stalls over {self.threshold * 1000:.0f}ms")
+
+    def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> Dict[str, float]:
+        return {"stalls": self.stalls, "max_lag_ms": self.max_lag * 1000}
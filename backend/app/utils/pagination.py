@@ -0,0 +1,48 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, List, NamedTuple, Optional, Tuple
+from sqlalchemy import Select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+class InvalidCursor(ValueError):
+    """A cursor that was not issued by keyset_page"""
+
+class Page(NamedTuple):
+    """One page of rows and the cursor of the next, None on the last page"""
+    items: List[Any]
+    next_cursor: Optional[str]
+
+def encode_cursor(sort_value: datetime, row_id: int) -> str:
+    """Opaque token for the position just after a row"""
+    payload = json.dumps([sort_value.isoformat(), row_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(sort_value), int(row_id)
+    except (TypeError, ValueError) as e:
+        raise InvalidCursor(f"Invalid cursor: {cursor}") from e
+
+async def keyset_page(db: AsyncSession, statement: Select, sort_column, id_column, cursor: Optional[str], limit: int) -> Page:
+    """Newest-first page of a select statement, continuing after cursor
+
+    Rows are ordered by (sort_column, id_column) descending and a page starts
+    strictly after the last row of the previous one, so with an index on the
+    filter columns followed by these two, every page is a range scan of
+    limit rows however deep it is. One extra row is read to know whether
+    another page follows.
+    """
+    if cursor:
+        sort_value, row_id = decode_cursor(cursor)
+        statement = statement.where(tuple_(sort_column, id_column) < tuple_(sort_value, row_id))
+
+    statement = statement.order_by(sort_column.desc(), id_column.desc()).limit(limit + 1)
+    rows = (await db.execute(statement)).scalars().all()
+    if len(rows) <= limit:
+        return Page(rows, None)
+
+    last = rows[limit - 1]
+    return Page(rows[:limit], encode_cursor(getattr(last, sort_column.key), getattr(last, id_column.key)))
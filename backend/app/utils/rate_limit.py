@@ -0,0 +1,154 @@
+import asyncio
+import time
+from typing import Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency that is known to be down"""
+
+class TokenBucket:
+    """Async token bucket shared by every caller of a rate-limited API
+
+    Tokens refill at `rate` per second up to `burst`. Callers queue on a lock,
+    so they are served in arrival order. A server-sent Retry-After pauses the
+    whole bucket rather than just the request that got it.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+        self._loop = None
+
+        self.waiting = 0
+        self.acquired = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _get_lock(self) -> asyncio.Lock:
+        # A lock belongs to one event loop, scripts and tests may run several in turn
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._lock = asyncio.Lock()
+            self._loop = loop
+        return self._lock
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        """Wait for a token"""
+        if self.rate <= 0:
+            return
+
+        started = time.monotonic()
+        self.waiting += 1
+        try:
+            async with self._get_lock():
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    delay = self._paused_until - now
+                    if delay <= 0:
+                        if self._tokens >= 1:
+                            self._tokens -= 1
+                            break
+                        delay = (1 - self._tokens) / self.rate
+                    await asyncio.sleep(delay)
+        finally:
+            self.waiting -= 1
+
+        waited = time.monotonic() - started
+        self.acquired += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+
+    def pause(self, seconds: float):
+        """Hand out no tokens for the next `seconds`, e.g. after a 429 with Retry-After"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+
+    def stats(self) -> dict:
+        return {
+            "rate": self.rate,
+            "burst": self.burst,
+            "queue_depth": self.waiting,
+            "acquired": self.acquired,
+            "avg_wait_seconds": self.total_wait / self.acquired if self.acquired else 0.0,
+            "max_wait_seconds": self.max_wait,
+            "paused_seconds": max(0.0, self._paused_until - time.monotonic())
+        }
+
+class CircuitBreaker:
+    """Stops calling a dependency after repeated failures, then probes it again
+
+    After `failure_threshold` consecutive failures the circuit opens and calls
+    are refused for `reset_timeout` seconds. Then a single trial call is let
+    through: success closes the circuit, failure opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_progress = False
+        self.times_opened = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow_request(self) -> bool:
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and not self._trial_in_progress:
+            self._trial_in_progress = True
+            return True
+
+        self.rejected += 1
+        return False
+
+    def record_success(self):
+        if self._opened_at is not None:
+            logger.info("Circuit closed, dependency recovered")
+        self.failures = 0
+        self._opened_at = None
+        self._trial_in_progress = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._trial_in_progress or (self._opened_at is None and self.failures >= self.failure_threshold):
+            if self._opened_at is None:
+                self.times_opened += 1
+                logger.warning(f"Circuit opened after {self.failures} consecutive failures")
+            self._opened_at = time.monotonic()
+        self._trial_in_progress = False
+
+    def release_trial(self):
+        """End a trial call that neither succeeded nor failed, the next call is let through as a new trial"""
+        self._trial_in_progress = False
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected
+        }
@@ -257,12 +257,20 @@ class ApiService {
 
     async getWatchlist() {
         try {
-            const response = await this.apiCall(`/users/watch-list`, {
-                headers: {
-                    'Authorization': `Bearer ${localStorage.getItem('token')}`
-                }
-            });
-            return response.watchlist || [];
+            // The watchlist is paged, follow the cursors to get all of it
+            const watchlist = [];
+            let cursor = null;
+            do {
+                const query = cursor ? `?limit=100&cursor=${encodeURIComponent(cursor)}` : '?limit=100';
+                const response = await this.apiCall(`/users/watch-list${query}`, {
+                    headers: {
+                        'Authorization': `Bearer ${localStorage.getItem('token')}`
+                    }
+                });
+                watchlist.push(...(response.watchlist || []));
+                cursor = response.next_cursor;
+            } while (cursor);
+            return watchlist;
         } catch (error) {
             console.error('Error getting watchlist:', error);
             return []; // Return empty array instead of throwing